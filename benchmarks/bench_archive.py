@@ -0,0 +1,70 @@
+"""
+Compression ratio and decode throughput of the chunked histogram archive (MEData.toArchive), with and without LS deltas, and the time to read a short LS range against decoding a whole ME.
+
+The counts follow a fixed shape scaled by a luminosity that decays over the run, with Poisson fluctuations, as per-LS DQM histograms do.
+"""
+
+import os
+import tempfile
+
+import numpy as np
+
+from synthetic import timeit
+from dqmexplore.medata import MEData
+from dqmexplore.utils.archiveutils import HistArchive
+
+
+def make_run(n_mes, n_lss, x_bin, seed=0):
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 1, x_bin)
+    lumi = 500 * np.exp(-np.arange(n_lss) / n_lss)
+    me_dict = {}
+    for i in range(n_mes):
+        shape = np.exp(-((x - rng.uniform(0.2, 0.8)) ** 2) / 0.02)
+        data = rng.poisson(np.outer(lumi, shape)).astype(float)
+        me_dict[f"Synthetic/me_{i}"] = {
+            "me_id": i,
+            "dim": 1,
+            "x_bins": np.linspace(0, 1, x_bin + 1),
+            "data": data,
+            "entries": data.sum(axis=1),
+        }
+    return MEData.fromMEDict(me_dict)
+
+
+def main():
+    me_data = make_run(100, 1000, 100)
+    me = me_data.getMENames()[0]
+    raw_bytes = sum(
+        me_data.getData(me).nbytes + me_data.getEntries(me).nbytes
+        for me in me_data.getMENames()
+    )
+    print(f"float64 arrays: {raw_bytes / 1e6:.1f} MB")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        npz_path = os.path.join(tmpdir, "me_data.npz")
+        me_data.save(npz_path)
+        print(f"MEData.save: {os.path.getsize(npz_path) / 1e6:.1f} MB")
+
+        print(
+            f"{'delta':>6} {'chunk':>6} {'size [MB]':>10} {'ratio':>6} "
+            f"{'decode [MB/s]':>14} {'10 LSs [ms]':>12} {'whole ME [ms]':>14}"
+        )
+        for delta in [False, True]:
+            for chunk_lss in [16, 64, 256]:
+                path = os.path.join(tmpdir, f"{delta}_{chunk_lss}.arc")
+                me_data.toArchive(path, chunk_lss=chunk_lss, delta=delta)
+                size = os.path.getsize(path)
+                t_all = timeit(lambda: MEData.fromArchive(path))
+                archive = HistArchive(path)
+                t_range = timeit(lambda: archive.read(me, 500, 509), repeat=20)
+                t_me = timeit(lambda: archive.read(me), repeat=20)
+                print(
+                    f"{str(delta):>6} {chunk_lss:>6} {size / 1e6:>10.2f} "
+                    f"{raw_bytes / size:>6.1f} {raw_bytes / t_all / 1e6:>14.0f} "
+                    f"{t_range * 1e3:>12.2f} {t_me * 1e3:>14.2f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
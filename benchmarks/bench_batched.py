@@ -0,0 +1,38 @@
+"""
+Wall time of normalizing, integrating and computing trends for many MEs sharing the same binning, ME by ME and batched into stacked tensors. Batching removes the per-ME Python overhead, which dominates for short runs and few bins; for long runs the work is bound by memory bandwidth either way.
+"""
+
+import numpy as np
+
+from synthetic import make_me_buffer, timeit
+from dqmexplore.medata import MEData
+from dqmexplore.trends import compute_trends
+
+
+def main():
+    print(
+        f"{'MEs':>6} {'LSs':>5} {'per ME [s]':>11} {'batched [s]':>12} {'speedup':>8}"
+    )
+    for n_mes, n_lss in [(200, 20), (1000, 20), (200, 500), (800, 500)]:
+        trigger_rate = np.random.default_rng(0).uniform(500, 1500, n_lss)
+        me_df, data_buffer = make_me_buffer(n_mes, n_lss, x_bin=20)
+        times = []
+        for batched in [False, True]:
+            me_data = MEData(me_df, data_buffer=data_buffer)
+            if batched:
+                me_data.batchMEs()
+
+            def derive():
+                me_data.normData()
+                me_data.integrateData()
+                compute_trends(me_data, trigger_rates=trigger_rate)
+
+            times.append(timeit(derive, setup=me_data.clearCache))
+        print(
+            f"{n_mes:>6} {n_lss:>5} {times[0]:>11.3f} {times[1]:>12.3f} "
+            f"{times[0] / times[1]:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
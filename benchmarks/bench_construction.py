@@ -0,0 +1,51 @@
+"""
+Compares MEData construction (single sort + contiguous slices) against the previous per-ME boolean masking implementation as the number of MEs grows.
+"""
+
+import numpy as np
+
+from synthetic import make_me_df, timeit
+from dqmexplore.me_ids import meIDs1D, meIDs2D
+from dqmexplore.utils.datautils import generate_me_dict
+
+
+def legacy_generate_me_dict(me_df):
+    me_dict = {}
+    for me in list(me_df["me"].unique()):
+        me_dict[me] = {}
+        sorted_dfsubset = me_df[me_df["me"] == me].sort_values(by="ls_number")
+        me_id = sorted_dfsubset["me_id"].unique()[0]
+        dim = 1 if me_id in meIDs1D else 2 if me_id in meIDs2D else None
+        me_dict[me]["x_bins"] = np.linspace(
+            sorted_dfsubset["x_min"].iloc[0],
+            sorted_dfsubset["x_max"].iloc[0],
+            int(sorted_dfsubset["x_bin"].iloc[0]),
+        )
+        me_dict[me]["me_id"] = me_id
+        me_dict[me]["dim"] = dim
+        me_dict[me]["data"] = np.array(sorted_dfsubset["data"].to_list())
+        me_dict[me]["entries"] = np.array(sorted_dfsubset["entries"].to_list())
+    return me_dict
+
+
+def main():
+    n_lss = 500
+    print(
+        f"{'MEs':>6} {'rows':>8} {'legacy [s]':>11} {'groupby [s]':>12} {'speedup':>8}"
+    )
+    for n_mes in [10, 50, 100, 200, 400]:
+        me_df = make_me_df(n_mes, n_lss, x_bin=50)
+
+        new, old = generate_me_dict(me_df), legacy_generate_me_dict(me_df)
+        for me in old:
+            assert np.array_equal(new[me]["data"], old[me]["data"])
+
+        t_old = timeit(lambda: legacy_generate_me_dict(me_df), repeat=1)
+        t_new = timeit(lambda: generate_me_dict(me_df), repeat=1)
+        print(
+            f"{n_mes:>6} {len(me_df):>8} {t_old:>11.3f} {t_new:>12.3f} {t_old / t_new:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Memory held by MEData for a large 2D map with both normalizations and the integral materialized, for the default and "compact" dtype policies.
+"""
+
+import numpy as np
+
+from synthetic import make_me_buffer, timeit
+from dqmexplore.medata import MEData
+
+
+def held_bytes(me_data, me):
+    return sum(
+        me_data[me][key].nbytes
+        for key in ["data", "entries", "norm", "trignorm", "integral"]
+    )
+
+
+def main():
+    n_lss = 2000
+    me_df, data_buffer = make_me_buffer(1, n_lss, x_bin=100, y_bin=80)
+    trigger_rate = np.random.default_rng(0).uniform(500, 1500, n_lss)
+
+    print(f"{'dtype':>8} {'data':>8} {'held [MB]':>10} {'norm+integrate [s]':>19}")
+    results = {}
+    for dtype in [None, "compact"]:
+        me_data = MEData(me_df, data_buffer=data_buffer, dtype=dtype)
+        me = me_data.getMENames()[0]
+
+        def derive():
+            me_data.normData()
+            me_data.normData(trigger_rate=trigger_rate)
+            me_data.integrateData()
+
+        t = timeit(derive, setup=me_data.clearCache)
+        results[dtype] = me_data
+        print(
+            f"{str(dtype):>8} {str(me_data.getData(me).dtype):>8} "
+            f"{held_bytes(me_data, me) / 1e6:>10.1f} {t:>19.3f}"
+        )
+
+    default, compact = results[None], results["compact"]
+    assert np.array_equal(default.getIntegral(me), compact.getIntegral(me))
+    rel_err = (
+        np.abs(compact.getNorm(me) - default.getNorm(me)).max()
+        / np.abs(default.getNorm(me)).max()
+    )
+    print(f"max relative deviation of compact norm: {rel_err:.1e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Compares building MEData for 2D MEs from Python list payloads against arrow-backed payloads, reporting wall time and peak memory allocated during construction.
+"""
+
+import tracemalloc
+
+import pandas as pd
+import pyarrow as pa
+
+from synthetic import make_me_df, timeit
+from dqmexplore.medata import MEData
+
+
+def peak_memory(func):
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    me_df = make_me_df(2, 1000, x_bin=72, y_bin=56)
+    table = pa.Table.from_pandas(me_df)
+    inputs = {
+        "pandas lists": me_df,
+        "pyarrow Table": table,
+        "pandas ArrowDtype": table.to_pandas(types_mapper=pd.ArrowDtype),
+    }
+
+    print(f"{'input':>18} {'time [s]':>9} {'peak [MB]':>10}")
+    for label, source in inputs.items():
+        t = timeit(lambda: MEData(source))
+        peak = peak_memory(lambda: MEData(source))
+        print(f"{label:>18} {t:>9.3f} {peak / 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
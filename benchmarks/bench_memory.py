@@ -0,0 +1,42 @@
+"""
+Peak memory and wall time of building, normalizing and integrating many 2D MEs without a memory budget and with budgets of a fraction of the data, plus the spill counters.
+"""
+
+import tracemalloc
+
+import numpy as np
+
+from synthetic import make_me_buffer, timeit
+from dqmexplore.medata import MEData
+
+
+def run(me_df, data_buffer, memory_budget):
+    me_data = MEData(me_df, data_buffer=data_buffer, memory_budget=memory_budget)
+    me_data.normData()
+    me_data.integrateData()
+    return me_data
+
+
+def main():
+    me_df, data_buffer = make_me_buffer(40, 200, x_bin=100, y_bin=50)
+    reference = run(me_df, data_buffer, None)
+    total = sum(reference.getData(me).nbytes for me in reference.getMENames())
+    print(f"data: {total / 1e6:.1f} MB")
+
+    print(f"{'budget [MB]':>12} {'peak [MB]':>10} {'time [s]':>9} {'spills':>7}")
+    for fraction in [None, 0.5, 0.1]:
+        budget = None if fraction is None else int(fraction * total)
+        tracemalloc.start()
+        me_data = run(me_df, data_buffer, budget)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        for me in reference.getMENames():
+            assert np.array_equal(me_data.getIntegral(me), reference.getIntegral(me))
+        t = timeit(lambda: run(me_df, data_buffer, budget), repeat=1)
+        label = "none" if budget is None else f"{budget / 1e6:.1f}"
+        spills = me_data.getMemoryStats()["spills"]
+        print(f"{label:>12} {peak / 1e6:>10.1f} {t:>9.3f} {spills:>7}")
+
+
+if __name__ == "__main__":
+    main()
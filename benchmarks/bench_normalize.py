@@ -0,0 +1,72 @@
+"""
+Peak memory and wall time of trigger-rate normalization of a large 2D map: the previous np.repeat implementation against the broadcasting one, with a fresh product, an in-place product and LS chunks.
+"""
+
+import tracemalloc
+
+import numpy as np
+
+from synthetic import make_me_buffer, timeit
+from dqmexplore.medata import MEData
+
+
+def legacy_trig_normalize(me_data, me, trigger_rate):
+    medata = me_data.getData(me)
+    n, m = medata.shape[1], medata.shape[2]
+    trignorm = np.zeros(medata.shape)
+    np.divide(
+        medata,
+        np.repeat(trigger_rate[:, np.newaxis], n * m, axis=1).reshape(-1, n, m),
+        out=trignorm,
+        where=~me_data.getExcludedMask()[:, np.newaxis, np.newaxis],
+    )
+    return trignorm
+
+
+def peak_mb(func):
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1e6
+
+
+def main():
+    n_lss = 1000
+    me_df, data_buffer = make_me_buffer(1, n_lss, x_bin=100, y_bin=80)
+    trigger_rate = np.random.default_rng(0).uniform(500, 1500, n_lss)
+    me_data = MEData(me_df, data_buffer=data_buffer)
+    me = me_data.getMENames()[0]
+    print(f"data: {me_data.getData(me).nbytes / 1e6:.1f} MB")
+
+    reference = legacy_trig_normalize(me_data, me, trigger_rate)
+    me_data.normData(trigger_rate=trigger_rate)
+    assert np.array_equal(me_data.getTrigNorm(me), reference)
+    del reference
+
+    variants = {
+        "np.repeat": lambda: legacy_trig_normalize(me_data, me, trigger_rate),
+        "broadcast": lambda: me_data.normData(trigger_rate=trigger_rate, mes=[me]),
+        "in place": lambda: me_data.normData(
+            trigger_rate=trigger_rate, mes=[me], inplace=True
+        ),
+        "chunks of 64 LSs": lambda: me_data.normData(
+            trigger_rate=trigger_rate, mes=[me], inplace=True, chunk_lss=64
+        ),
+    }
+    print(f"{'variant':>18} {'peak [MB]':>10} {'time [s]':>9}")
+    for name, func in variants.items():
+        me_data.normData(trigger_rate=trigger_rate)
+
+        # Drop the cache key only, so that in place variants find their buffer
+        def clear():
+            me_data[me]["keys"].pop("trignorm", None)
+
+        clear()
+        peak = peak_mb(func)
+        t = timeit(func, setup=clear)
+        print(f"{name:>18} {peak:>10.1f} {t:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Number of OMS requests and wall time of OMSData.fetchData for a few hundred runs against the fake OMS backend (5 ms per request): one request per run against run range queries with different gap tolerances.
+"""
+
+import numpy as np
+import pandas as pd
+
+from synthetic import timeit
+from fake_oms import FakeDials
+from dqmexplore.omsdata import OMSData
+
+
+def fetch(dials, runnbs, endpoint, **kwargs):
+    oms_data = OMSData(dials)
+    oms_data.setRuns(runnbs)
+    oms_data.fetchData(endpoint=endpoint, **kwargs)
+    return oms_data.getData(endpoint).sort_index()
+
+
+def main():
+    rng = np.random.default_rng(0)
+    # Runs of a data-taking period: mostly consecutive, with gaps of test runs
+    all_runs = 380000 + np.cumsum(rng.choice([1, 1, 1, 2, 5, 30], size=400))
+    dials = FakeDials(all_runs, max_limit=10000, latency=0.005)
+    runnbs = rng.choice(all_runs, size=300, replace=False).tolist()
+
+    for endpoint in ["runs", "lumisections"]:
+        reference = fetch(dials, runnbs, endpoint, max_gap=None)
+        print(f"{endpoint}: {len(reference)} records")
+        print(f"{'max_gap':>8} {'requests':>9} {'time [s]':>9}")
+        for max_gap in [None, 0, 10, 100]:
+            dials.oms.requests.clear()
+            fetched = fetch(dials, runnbs, endpoint, max_gap=max_gap)
+            n_requests = len(dials.oms.requests)
+            pd.testing.assert_frame_equal(fetched, reference)
+            t = timeit(lambda: fetch(dials, runnbs, endpoint, max_gap=max_gap))
+            print(f"{str(max_gap):>8} {n_requests:>9} {t:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+Wall time and OMS requests of OMSData.fetchData for the runs and lumisections of 100 runs from the fake OMS backend (5 ms per request), without a cache, with an empty cache and with a warm one reopened from disk as in a new session.
+"""
+
+import tempfile
+
+from synthetic import timeit
+from fake_oms import FakeDials
+from dqmexplore.omsdata import OMSData
+from dqmexplore.utils.cacheutils import ResponseCache
+
+
+def fetch(dials, runnbs, cache):
+    oms_data = OMSData(dials, cache=cache)
+    oms_data.setRuns(runnbs)
+    for endpoint in ["runs", "lumisections"]:
+        oms_data.fetchData(endpoint=endpoint, max_gap=None)
+    return oms_data
+
+
+def main():
+    runnbs = list(range(380000, 380100))
+    dials = FakeDials(runnbs, latency=0.005)
+    cache_dir = tempfile.mkdtemp(prefix="dqmexplore-cache-")
+
+    variants = {
+        "no cache": lambda: fetch(dials, runnbs, None),
+        "cold cache": lambda: fetch(dials, runnbs, ResponseCache(cache_dir)),
+        "warm cache": lambda: fetch(dials, runnbs, ResponseCache(cache_dir)),
+    }
+    print(f"{'variant':>12} {'requests':>9} {'time [s]':>9}")
+    for name, func in variants.items():
+        dials.oms.requests.clear()
+        t = timeit(func, repeat=1)
+        print(f"{name:>12} {len(dials.oms.requests):>9} {t:>9.3f}")
+    print(ResponseCache(cache_dir).stats())
+
+
+if __name__ == "__main__":
+    main()
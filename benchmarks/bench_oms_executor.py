@@ -0,0 +1,46 @@
+"""
+OMSData.fetchData for 200 runs against the fake OMS backend with 10 ms of latency and 10% of transient errors, with different FetchExecutor settings: wall time, requests sent, peak requests in flight, retries and runs lost.
+"""
+
+import warnings
+
+from synthetic import timeit
+from fake_oms import FakeDials
+from dqmexplore.omsdata import OMSData
+from dqmexplore.utils.fetchutils import FetchExecutor
+
+
+def main():
+    runnbs = list(range(380000, 380200))
+    variants = {
+        "1 worker": dict(max_workers=1, backoff=0.01),
+        "4 workers, no retries": dict(max_workers=4, retries=0),
+        "4 workers": dict(max_workers=4, backoff=0.01),
+        "16 workers": dict(max_workers=16, backoff=0.01),
+        "16 workers, 100/s": dict(max_workers=16, rate=100, burst=10, backoff=0.01),
+    }
+    print(
+        f"{'variant':>22} {'time [s]':>9} {'requests':>9} {'in flight':>10} {'retries':>8} {'lost':>5}"
+    )
+    for name, kwargs in variants.items():
+        dials = FakeDials(runnbs, latency=0.01, error_rate=0.1)
+        executor = FetchExecutor(**kwargs)
+        oms_data = OMSData(dials, executor=executor)
+        oms_data.setRuns(runnbs)
+        fetch_results = []
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            t = timeit(
+                lambda: fetch_results.append(
+                    oms_data.fetchData("runs", keep_prev=False, max_gap=None)
+                ),
+                repeat=1,
+            )
+        print(
+            f"{name:>22} {t:>9.3f} {len(dials.oms.requests):>9} {dials.oms.max_in_flight:>10} "
+            f"{executor.stats['retries']:>8} {len(fetch_results[-1].failures):>5}"
+        )
+
+
+if __name__ == "__main__":
+    main()
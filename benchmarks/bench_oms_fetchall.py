@@ -0,0 +1,49 @@
+"""
+Wall time of fetching the runs, lumisections and datasetrates endpoints for 40 runs in four run ranges from the fake OMS backend (100 ms per request): one fetchData call per endpoint against a single fetchAll, with the per-endpoint timings of fetchAll.
+"""
+
+import pandas as pd
+
+from synthetic import timeit
+from fake_oms import FakeDials
+from dqmexplore.omsdata import OMSData
+from dqmexplore.utils.fetchutils import FetchExecutor
+
+ENDPOINTS = ["runs", "lumisections", "datasetrates"]
+
+
+def fetch_each(oms_data):
+    for endpoint in ENDPOINTS:
+        oms_data.fetchData(endpoint, keep_prev=False)
+
+
+def fetch_all(oms_data):
+    oms_data.fetchAll(ENDPOINTS, keep_prev=False)
+
+
+def main():
+    # Four fills of consecutive runs, i.e. four run ranges per endpoint
+    runnbs = [380000 + 100 * fill + i for fill in range(4) for i in range(10)]
+    dials = FakeDials(runnbs, latency=0.1)
+    each = OMSData(dials, executor=FetchExecutor(max_workers=8))
+    each.setRuns(runnbs)
+    together = OMSData(dials, executor=FetchExecutor(max_workers=8))
+    together.setRuns(runnbs)
+
+    fetch_each(each)
+    fetch_all(together)
+    for endpoint in ENDPOINTS:
+        pd.testing.assert_frame_equal(each[endpoint], together[endpoint])
+
+    print(f"{'variant':>18} {'time [s]':>9}")
+    print(f"{'fetchData x 3':>18} {timeit(lambda: fetch_each(each)):>9.3f}")
+    print(f"{'fetchAll':>18} {timeit(lambda: fetch_all(together)):>9.3f}")
+    print(f"{'endpoint':>18} {'ranges':>7} {'wall [s]':>9} {'busy [s]':>9}")
+    for endpoint, timing in together.getTimings().items():
+        print(
+            f"{endpoint:>18} {timing['ranges']:>7} {timing['wall']:>9.3f} {timing['busy']:>9.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Wall time of fetching every page of a large lumisections query from the fake OMS backend (1000 records per page, 5 ms per request): sequential pages concatenated with pd.concat, the pre-sized buffer of fetch_frame with sequential and concurrent pages, and the per-page generator.
+"""
+
+import pandas as pd
+from cmsdials.filters import OMSPage
+
+from synthetic import timeit
+from fake_oms import FakeDials
+from dqmexplore.utils.datautils import makeDF
+from dqmexplore.utils.omsutils import fetch_frame, iter_frames, run_range_filters
+
+
+def concat_pages(dials, endpoint, filters, page_limit):
+    df = None
+    offset = 0
+    while True:
+        response = dials.oms.query(
+            endpoint=endpoint,
+            filters=filters,
+            pages=[
+                OMSPage(attribute_name="limit", value=page_limit),
+                OMSPage(attribute_name="offset", value=offset),
+            ],
+        )
+        if len(response["data"]) == 0:
+            return df
+        page = makeDF(response)
+        df = page if df is None else pd.concat([df, page], ignore_index=True)
+        offset += len(response["data"])
+
+
+def main():
+    runnbs = list(range(380000, 380040))
+    dials = FakeDials(runnbs, n_lss=(1000, 2000), max_limit=1000, latency=0.005)
+    filters = run_range_filters(runnbs[0], runnbs[-1])
+    endpoint = "lumisections"
+    reference = fetch_frame(dials, endpoint, filters, page_limit=1000, max_workers=1)
+    print(f"{endpoint}: {len(reference)} records")
+
+    pd.testing.assert_frame_equal(
+        concat_pages(dials, endpoint, filters, 1000), reference
+    )
+
+    variants = {
+        "pd.concat": lambda: concat_pages(dials, endpoint, filters, 1000),
+        "buffer": lambda: fetch_frame(
+            dials, endpoint, filters, page_limit=1000, max_workers=1
+        ),
+        "buffer, 8 threads": lambda: fetch_frame(
+            dials, endpoint, filters, page_limit=1000, max_workers=8
+        ),
+        "generator, 8 threads": lambda: sum(
+            len(df)
+            for df in iter_frames(
+                dials, endpoint, filters, page_limit=1000, max_workers=8
+            )
+        ),
+    }
+    print(f"{'variant':>22} {'time [s]':>9}")
+    for name, func in variants.items():
+        print(f"{name:>22} {timeit(func):>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
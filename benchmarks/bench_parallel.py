@@ -0,0 +1,46 @@
+"""
+Wall time of building an MEData and deriving its products (area and trigger-rate normalizations, integrals and trends) for a few hundred MEs, serially and on thread pools of increasing size. The speedup is bounded by the number of cores of the node.
+"""
+
+import os
+
+import numpy as np
+
+from synthetic import make_me_buffer, timeit
+from dqmexplore.medata import MEData
+from dqmexplore.trends import compute_trends
+
+
+def main():
+    n_lss = 500
+    me_df, data_buffer = make_me_buffer(300, n_lss, x_bin=200)
+    trigger_rate = np.random.default_rng(0).uniform(500, 1500, n_lss)
+    n_cores = os.cpu_count()
+    print(f"cores: {n_cores}")
+
+    print(f"{'workers':>8} {'build [s]':>10} {'derive [s]':>11} {'speedup':>8}")
+    serial = None
+    for max_workers in sorted({None, 2, 4, n_cores}, key=lambda n: n or 0):
+
+        def build():
+            return MEData(me_df, data_buffer=data_buffer, max_workers=max_workers)
+
+        me_data = build()
+
+        def derive():
+            me_data.normData()
+            me_data.integrateData()
+            compute_trends(me_data, trigger_rates=trigger_rate)
+
+        t_build = timeit(build)
+        t_derive = timeit(derive, setup=me_data.clearCache)
+        if serial is None:
+            serial = t_build + t_derive
+        print(
+            f"{str(max_workers):>8} {t_build:>10.3f} {t_derive:>11.3f} "
+            f"{serial / (t_build + t_derive):>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
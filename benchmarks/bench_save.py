@@ -0,0 +1,41 @@
+"""
+Time to get an MEData back in a new session: rebuilding it from a pickled dataframe (the caching used by the scripts) against MEData.load, for the whole file and for a few MEs.
+"""
+
+import os
+import tempfile
+
+import pandas as pd
+
+from synthetic import make_me_df, timeit
+from dqmexplore.medata import MEData
+
+
+def main():
+    me_df = make_me_df(200, 500, x_bin=100)
+    me_data = MEData(me_df, dtype="compact")
+    mes = me_data.getMENames()[:5]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        pkl_path = os.path.join(tmpdir, "me_df.pkl")
+        npz_path = os.path.join(tmpdir, "me_data.npz")
+        me_df.to_pickle(pkl_path)
+        me_data.save(npz_path)
+
+        results = [
+            (
+                "pickle + rebuild",
+                pkl_path,
+                lambda: MEData(pd.read_pickle(pkl_path), dtype="compact"),
+            ),
+            ("MEData.load", npz_path, lambda: MEData.load(npz_path)),
+            ("MEData.load, 5 MEs", None, lambda: MEData.load(npz_path, mes=mes)),
+        ]
+        print(f"{'source':>20} {'size [MB]':>10} {'time [s]':>9}")
+        for name, path, func in results:
+            size = "" if path is None else f"{os.path.getsize(path) / 1e6:.1f}"
+            print(f"{name:>20} {size:>10} {timeit(func):>9.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+Memory and throughput of dense vs sparse storage for 2D MEs at different bin occupancies.
+"""
+
+import numpy as np
+
+from synthetic import make_me_buffer, timeit
+from dqmexplore.medata import MEData
+
+
+def main():
+    n_lss = 1000
+    trigger_rate = np.random.default_rng(0).uniform(500, 1500, n_lss)
+
+    print(
+        f"{'occupancy':>9} {'storage':>8} {'data [MB]':>10} "
+        f"{'integrate [s]':>14} {'normData [s]':>13} {'trig norm [s]':>14}"
+    )
+    for occupancy in [0.01, 0.05, 0.2, 0.5]:
+        me_df, data_buffer = make_me_buffer(
+            1, n_lss, x_bin=100, y_bin=80, occupancy=occupancy
+        )
+        for sparse in [False, True]:
+            me_data = MEData(me_df, data_buffer=data_buffer, sparse=sparse)
+            me = me_data.getMENames()[0]
+            t_int = timeit(lambda: me_data.integrateData(), setup=me_data.clearCache)
+            t_norm = timeit(lambda: me_data.normData(), setup=me_data.clearCache)
+            t_trig = timeit(
+                lambda: me_data.normData(trigger_rate=trigger_rate),
+                setup=me_data.clearCache,
+            )
+            print(
+                f"{occupancy:>9.2f} {'sparse' if sparse else 'dense':>8} "
+                f"{me_data.getData(me).nbytes / 1e6:>10.1f} "
+                f"{t_int:>14.4f} {t_norm:>13.4f} {t_trig:>14.4f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+In-process stand-in for dials.oms: serves synthetic runs, lumisections and datasetrates records, applies run_number filters and page limits like the OMS proxy, and counts requests. latency (in seconds) is added to every request, and a fraction error_rate of the requests fails with a 503 (transient) HTTP error. Requests for the runs in broken_runs always fail with a 400 error.
+"""
+
+import functools
+import threading
+import time
+
+import numpy as np
+import requests
+
+
+def _http_error(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    return requests.HTTPError(f"{status_code} Error", response=response)
+
+
+class FakeOMS:
+    def __init__(
+        self,
+        runnbs,
+        n_lss=(50, 500),
+        max_limit=10000,
+        latency=0.0,
+        error_rate=0.0,
+        broken_runs=(),
+        seed=0,
+    ):
+        rng = np.random.default_rng(seed)
+        self.max_limit = max_limit
+        self.latency = latency
+        self.error_rate = error_rate
+        self.broken_runs = set(broken_runs)
+        self._errors = np.random.default_rng(seed + 1)
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        # {endpoint: {run_number: records}}
+        self.tables = {"runs": {}, "lumisections": {}, "datasetrates": {}}
+        for run in sorted(int(run) for run in runnbs):
+            num_lss = int(rng.integers(*n_lss))
+            self.tables["runs"][run] = [
+                {
+                    "run_number": run,
+                    "last_lumisection_number": num_lss,
+                    "end_time": "2024-08-01T00:00:00Z",
+                }
+            ]
+            self.tables["lumisections"][run] = [
+                {
+                    "run_number": run,
+                    "lumisection_number": ls,
+                    "recorded_lumi": float(lumi),
+                }
+                for ls, lumi in enumerate(rng.uniform(0, 1, num_lss), start=1)
+            ]
+            self.tables["datasetrates"][run] = [
+                {
+                    "run_number": run,
+                    "dataset_name": "ZeroBias",
+                    "last_lumisection_number": ls,
+                    "rate": float(rate),
+                }
+                for ls, rate in enumerate(rng.uniform(500, 1500, num_lss), start=1)
+            ]
+
+    def startRun(self, run):
+        """
+        Marks a run as ongoing (no end_time).
+        """
+        self.tables["runs"][run][0]["end_time"] = None
+
+    def query(self, endpoint, filters, pages=None):
+        # Same parameter encoding as the DIALS client: one value per (attribute, operator)
+        params = {
+            (_filter.attribute_name, _filter.operator): _filter.value
+            for _filter in filters
+        }
+        page = {page.attribute_name: page.value for page in pages or []}
+        with self._lock:
+            self.requests.append((endpoint, params, page))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            fail = self._errors.random() < self.error_rate
+        try:
+            time.sleep(self.latency)
+            if fail:
+                raise _http_error(503)
+            rows = self._select(endpoint, tuple(sorted(params.items())))
+            if any(row["run_number"] in self.broken_runs for row in rows):
+                raise _http_error(400)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        offset = page.get("offset", 0)
+        limit = min(page.get("limit", self.max_limit), self.max_limit)
+        return {
+            "data": [
+                {"id": i, "type": endpoint, "attributes": dict(row)}
+                for i, row in enumerate(rows[offset : offset + limit], start=offset)
+            ],
+            "meta": {"totalResourceCount": len(rows)},
+            "links": {},
+        }
+
+    @functools.lru_cache(maxsize=64)
+    def _select(self, endpoint, params):
+        # Cached, so that requests for further pages only pay the latency
+        operators = {
+            "EQ": lambda a, b: a == b,
+            "GE": lambda a, b: a >= b,
+            "LE": lambda a, b: a <= b,
+            "GT": lambda a, b: a > b,
+            "LT": lambda a, b: a < b,
+        }
+        # Records are grouped by run, so run filters do not scan every record
+        runs = [
+            run
+            for run in self.tables[endpoint]
+            if all(
+                operators[op](run, value)
+                for (attribute, op), value in params
+                if attribute == "run_number"
+            )
+        ]
+        rows = [
+            row
+            for run in runs
+            for row in self.tables[endpoint][run]
+            if all(
+                operators[op](row[attribute], value)
+                for (attribute, op), value in params
+                if attribute != "run_number"
+            )
+        ]
+        return rows
+
+
+class FakeDials:
+    def __init__(self, *args, **kwargs):
+        self.oms = FakeOMS(*args, **kwargs)
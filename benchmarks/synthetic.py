@@ -0,0 +1,93 @@
+"""
+Synthetic DIALS-like monitoring element dataframes for the benchmarks in this directory.
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+ME_ID_1D = 1
+ME_ID_2D = 96
+
+
+def make_me_df(n_mes, n_lss, x_bin=100, y_bin=None, occupancy=1.0, seed=0):
+    """
+    Builds a dataframe shaped like dials.h1d/h2d.list_all(...).to_pandas(), with rows shuffled as they come from paginated queries. For 2D MEs (y_bin given), occupancy is the fraction of non-empty bins per LS.
+    """
+    rng = np.random.default_rng(seed)
+    dim = 1 if y_bin is None else 2
+    shape = (x_bin,) if dim == 1 else (y_bin, x_bin)
+
+    rows = []
+    for i in range(n_mes):
+        counts = rng.poisson(20, size=(n_lss, *shape)).astype(float)
+        if occupancy < 1:
+            counts *= rng.random(counts.shape) < occupancy
+        for ls in range(n_lss):
+            row = {
+                "dataset": "/ZeroBias/Run2024F-PromptReco-v1/DQMIO",
+                "me": f"Synthetic/Folder_{i % 4}/me_{i}",
+                "run_number": 380238,
+                "ls_number": ls + 1,
+                "me_id": ME_ID_1D if dim == 1 else ME_ID_2D,
+                "x_min": 0.0,
+                "x_max": float(x_bin),
+                "x_bin": float(x_bin),
+                "entries": int(counts[ls].sum()),
+                "data": counts[ls].tolist(),
+            }
+            if dim == 2:
+                row.update({"y_min": 0.0, "y_max": float(y_bin), "y_bin": y_bin})
+            rows.append(row)
+
+    me_df = pd.DataFrame(rows)
+    return me_df.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+def make_me_buffer(n_mes, n_lss, x_bin=100, y_bin=None, occupancy=1.0, seed=0):
+    """
+    Same as make_me_df but returns the metadata dataframe and the (values, offsets) buffer taken by MEData(..., data_buffer=...), which scales to large 2D maps without building Python lists.
+    """
+    rng = np.random.default_rng(seed)
+    dim = 1 if y_bin is None else 2
+    n_bins = x_bin if dim == 1 else x_bin * y_bin
+
+    values = rng.poisson(20, size=(n_mes * n_lss, n_bins)).astype(float)
+    if occupancy < 1:
+        values *= rng.random(values.shape) < occupancy
+    me_df = pd.DataFrame(
+        {
+            "me": np.repeat(
+                [f"Synthetic/Folder_{i % 4}/me_{i}" for i in range(n_mes)], n_lss
+            ),
+            "ls_number": np.tile(np.arange(1, n_lss + 1), n_mes),
+            "me_id": ME_ID_1D if dim == 1 else ME_ID_2D,
+            "x_min": 0.0,
+            "x_max": float(x_bin),
+            "x_bin": float(x_bin),
+            "entries": values.sum(axis=1).astype(int),
+        }
+    )
+    if dim == 2:
+        me_df["y_min"], me_df["y_max"], me_df["y_bin"] = 0.0, float(y_bin), y_bin
+    offsets = np.arange(len(me_df) + 1) * n_bins
+    return me_df, (values.ravel(), offsets)
+
+
+def timeit(func, repeat=3, setup=None):
+    """
+    Returns the best wall time in seconds of func() over repeat calls. setup() runs untimed before each call.
+    """
+    best = np.inf
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
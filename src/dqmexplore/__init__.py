@@ -1,5 +1,6 @@
 # Data managers
 import dqmexplore.medata
+import dqmexplore.multirundata
 import dqmexplore.omsdata
 import dqmexplore.certhelper
 
@@ -9,6 +10,16 @@ import dqmexplore.staticplt
 import dqmexplore.trends
 
 # Utilities
-from dqmexplore.utils import datautils, omsutils, setupdials
+from dqmexplore.utils import (
+    datautils,
+    omsutils,
+    setupdials,
+    sparseutils,
+    archiveutils,
+    pathutils,
+    cacheutils,
+    fetchutils,
+    memutils,
+)
 import dqmexplore.oms
 import dqmexplore.anomaly
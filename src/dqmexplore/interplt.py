@@ -147,19 +147,24 @@ def create_plot(
     for i, me in enumerate(mes):
         row = (i // num_cols) + 1
         col = (i % num_cols) + 1
-        for ls in range(num_lss):
+        for ls in range(1, num_lss + 1):
+            # LSs missing for this ME are shown empty
+            if me_data.hasLS(me, ls):
+                hist = me_data.getData(me, ls=ls, type=to_plot)
+            else:
+                hist = np.zeros(me_data.getData(me, type=to_plot).shape[1:])
             if me_data.getDims(me) == 1:
                 trace = go.Bar()
                 trace.x = me_data.getBins(me, dim="x")
-                trace.y = me_data.getData(me, ls=ls, type=to_plot)
+                trace.y = hist
             elif me_data.getDims(me) == 2:
                 trace = go.Heatmap()
                 trace.x = me_data.getBins(me, dim="x")
                 trace.y = me_data.getBins(me, dim="y")
-                trace.z = me_data.getData(me, ls=ls, type=to_plot)
+                trace.z = hist
             trace.name = me
 
-            trace.visible = ls == 0
+            trace.visible = ls == 1
             traces.append(trace)
             fig.add_trace(traces[-1], row=row, col=col)
 
@@ -201,7 +206,7 @@ def create_plot(
         row = (i // num_cols) + 1
         col = (i % num_cols) + 1
 
-        max_data = me_data.getData(me, type=to_plot).max()
+        max_data = me_data.maxData(me, type=to_plot)
         if me_data.getDims(me) == 1:
             fig.update_yaxes(range=[0, max_data], row=row, col=col)
 
@@ -1,62 +1,389 @@
 import numpy as np
-from dqmexplore.me_ids import meIDs1D, meIDs2D
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dqmexplore.utils.datautils import (
+    index_me_rows,
+    build_me_entry,
+    compact_counts,
+    accumulator_dtype,
+    merge_ls_ranges,
+    subtract_ls_ranges,
+    ls_ranges_mask,
+    array_fingerprint,
+)
+from dqmexplore.utils.sparseutils import SparseLSArray
+from dqmexplore.utils.archiveutils import HistArchive, write_archive
+from dqmexplore.utils.pathutils import GLOB_CHARS, MEPathIndex
+from dqmexplore.utils.memutils import MemoryManager
 import warnings
 
+STORE_VERSION = 2
+FILE_VERSION = 2
+
 
 class MEData:
-    def __init__(self, me_df):
+    def __init__(
+        self,
+        me_df,
+        data_buffer=None,
+        dtype=None,
+        lazy=False,
+        max_resident=None,
+        sparse=False,
+        max_workers=None,
+        memory_budget=None,
+        scratch_dir=None,
+    ):
+        """
+        me_df is a DataFrame as returned by dials.h1d/h2d.list_all(...).to_pandas() or a pyarrow Table, or the metadata of the rows of a flat (values, offsets) data_buffer. dtype="compact" stores counts in the smallest exact type, lazy=True builds MEs on first access (keeping at most max_resident), sparse=True stores 2D MEs as SparseLSArray, max_workers > 1 runs per-ME work on a thread pool and memory_budget spills MEs to scratch_dir (see setMemoryBudget).
+        """
+        self._setup(
+            dtype=dtype,
+            lazy=lazy,
+            max_resident=max_resident,
+            sparse=sparse,
+            max_workers=max_workers,
+        )
+        if memory_budget is not None:
+            self.setMemoryBudget(memory_budget, scratch_dir=scratch_dir)
+        self._generate_me_dict(me_df, data_buffer=data_buffer)
+
+    @classmethod
+    def fromMEDict(cls, me_dict, dtype=None):
+        """
+        Builds an MEData from a dictionary in the format returned by datautils.generate_me_dict (x_bins, y_bins, me_id, dim, data and entries per ME). The LS numbers of the rows can be given per ME as ls_numbers, and default to 1, 2, ... otherwise.
+        """
+        me_data = cls.__new__(cls)
+        me_data._setup(dtype=dtype)
+        me_data._columns = None
+        me_data._me_rows = {
+            me: (0, len(me_entry["data"])) for me, me_entry in me_dict.items()
+        }
+        for me, me_entry in me_dict.items():
+            me_data._addME(me, dict(me_entry))
+        me_data._setNumLSs()
+        return me_data
+
+    def toStore(self, path):
+        """
+        Writes the data and entries of every ME to a directory of .npy files, plus a meta.json sidecar with the bins, IDs, storage policy and exclusions, to be reopened with fromStore.
+        """
+        os.makedirs(path, exist_ok=True)
+        meta = self._fileMeta(STORE_VERSION)
+        for i, me in enumerate(self.getMENames()):
+            me_meta, arrays = self._meLayout(me)
+            for key in ["x_bins", "y_bins"]:
+                if key in arrays:
+                    me_meta[key] = arrays.pop(key).tolist()
+            me_meta["files"] = {}
+            for key, arr in arrays.items():
+                me_meta["files"][key] = f"{i}_{key}.npy"
+                np.save(os.path.join(path, me_meta["files"][key]), arr)
+            meta["mes"].append(me_meta)
+
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=1)
+
+    @classmethod
+    def fromStore(cls, path, mes=None, mmap_mode="r"):
+        """
+        Opens a directory written by toStore. Arrays are memory-mapped (mmap_mode="r" by default), so getData(me, ls=...), integrals and trends only read the LSs they touch from disk. mes selects a subset of MEs to open.
+        """
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            meta = json.load(f)
+        if meta["version"] > STORE_VERSION:
+            raise ValueError(
+                f"Store version {meta['version']} is newer than supported ({STORE_VERSION})."
+            )
+
+        me_data = cls._fromFileMeta(meta)
+        for me_meta in meta["mes"]:
+            if mes is not None and me_meta["name"] not in mes:
+                continue
+            arrays = {
+                key: np.load(os.path.join(path, filename), mmap_mode=mmap_mode)
+                for key, filename in me_meta["files"].items()
+            }
+            for key in ["x_bins", "y_bins"]:
+                if key in me_meta:
+                    arrays[key] = np.array(me_meta[key])
+            me_data._addStoredME(me_meta, arrays)
+        me_data._setNumLSs(meta.get("numLSs"))
+        me_data.setExcluded([tuple(interval) for interval in meta["excluded"]])
+        return me_data
+
+    def save(self, path):
+        """
+        Writes the MEData, without derived products, to a single uncompressed .npz file with a JSON header. Reopen with MEData.load.
+        """
+        meta = self._fileMeta(FILE_VERSION)
+        arrays = {}
+        for i, me in enumerate(self.getMENames()):
+            me_meta, me_arrays = self._meLayout(me)
+            me_arrays["emptyLSs"] = np.array(self.getEmptyLSs(me), dtype=np.int64)
+            for key, arr in me_arrays.items():
+                arrays[f"{i}/{key}"] = arr
+            meta["mes"].append(me_meta)
+        arrays["meta"] = np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8)
+
+        with open(path, "wb") as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path, mes=None):
+        """
+        Opens a file written by save. Only the arrays of the MEs listed in mes (all by default) are read. Files written by older versions of save are still read: version 1 files have no LS numbers, their rows are LSs 1, 2, ...
+        """
+        with np.load(path) as arrays:
+            meta = json.loads(arrays["meta"].tobytes().decode())
+            if meta["version"] > FILE_VERSION:
+                raise ValueError(
+                    f"File version {meta['version']} is newer than supported ({FILE_VERSION})."
+                )
+
+            me_data = cls._fromFileMeta(meta)
+            names = {}
+            for name in arrays.files:
+                if "/" in name:
+                    i, key = name.split("/", 1)
+                    names.setdefault(int(i), []).append(key)
+            for i, me_meta in enumerate(meta["mes"]):
+                if mes is not None and me_meta["name"] not in mes:
+                    continue
+                me_data._addStoredME(
+                    me_meta, {key: arrays[f"{i}/{key}"] for key in names[i]}
+                )
+        me_data._setNumLSs(meta.get("numLSs"))
+        me_data.setExcluded([tuple(interval) for interval in meta["excluded"]])
+        return me_data
+
+    def _fileMeta(self, version):
+        return {
+            "version": version,
+            "dtype": self.dtype,
+            "sparse": self.sparse,
+            "numLSs": int(self.numLSs),
+            "excluded": self._excluded_intervals.tolist(),
+            "mes": [],
+        }
+
+    @classmethod
+    def _fromFileMeta(cls, meta):
+        me_data = cls.__new__(cls)
+        me_data._setup(dtype=meta["dtype"], sparse=meta["sparse"])
+        me_data._columns = None
+        me_data._me_rows = {}
+        return me_data
+
+    def _meLayout(self, me):
+        """
+        Metadata and arrays of an ME as written by save and toStore, sparse data being split into its values, indices and indptr.
+        """
+        me_entry = self._getME(me)
+        me_meta = {
+            "name": me,
+            "me_id": int(me_entry["me_id"]),
+            "dim": int(me_entry["dim"]),
+        }
+        arrays = {
+            "x_bins": np.asarray(me_entry["x_bins"]),
+            "entries": np.asarray(me_entry["entries"]),
+            "ls_numbers": me_entry["ls_numbers"],
+        }
+        if me_entry["dim"] == 2:
+            arrays["y_bins"] = np.asarray(me_entry["y_bins"])
+        medata = me_entry["data"]
+        if isinstance(medata, SparseLSArray):
+            me_meta["shape"] = list(medata.shape)
+            for part in ["values", "indices", "indptr"]:
+                arrays[f"data_{part}"] = getattr(medata, part)
+        else:
+            arrays["data"] = np.asarray(medata)
+        return me_meta, arrays
+
+    def _addStoredME(self, me_meta, arrays):
+        """
+        Adds an ME from the metadata and arrays of _meLayout, as read back by load and fromStore.
+        """
+        me_entry = {
+            "me_id": me_meta["me_id"],
+            "dim": me_meta["dim"],
+            "x_bins": arrays["x_bins"],
+            "entries": arrays["entries"],
+        }
+        if "ls_numbers" in arrays:
+            me_entry["ls_numbers"] = np.asarray(arrays["ls_numbers"])
+        if me_meta["dim"] == 2:
+            me_entry["y_bins"] = arrays["y_bins"]
+        if "shape" in me_meta:
+            me_entry["data"] = SparseLSArray(
+                arrays["data_values"],
+                arrays["data_indices"],
+                arrays["data_indptr"],
+                me_meta["shape"],
+            )
+        else:
+            me_entry["data"] = arrays["data"]
+        me = me_meta["name"]
+        self._me_rows[me] = (0, len(me_entry["entries"]))
+        self._addLSNumbers(me_entry)
+        self.me_dict[me] = me_entry
+        if "emptyLSs" in arrays:
+            me_entry["emptyLSs"] = list(arrays["emptyLSs"])
+        else:
+            self._setEmptyLSs(mes=[me])
+
+    def toArchive(self, path, chunk_lss=64, level=6, delta=True):
+        """
+        Writes the data and entries of every ME to a compressed archive of chunks of chunk_lss LSs (see archiveutils.write_archive), for long term storage of many runs. Read it back with fromArchive, or read LS ranges with archiveutils.HistArchive.
+        """
+        write_archive(self, path, chunk_lss=chunk_lss, level=level, delta=delta)
+
+    @classmethod
+    def fromArchive(cls, path, mes=None):
+        """
+        Decodes the MEs listed in mes (all by default) from an archive written by toArchive.
+        """
+        archive = HistArchive(path)
+        me_data = cls.fromMEDict(
+            archive.toMEDict(mes=mes), dtype=archive.header["dtype"]
+        )
+        me_data._setNumLSs(archive.getNumLSs())
+        me_data.setExcluded(archive.header["excluded"])
+        return me_data
+
+    def _setup(
+        self, dtype=None, lazy=False, max_resident=None, sparse=False, max_workers=None
+    ):
+        if dtype not in (None, "compact"):
+            raise ValueError('dtype must be either None or "compact".')
+        if max_resident is not None and not lazy:
+            raise ValueError("max_resident can only be used with lazy=True.")
+        self.dtype = dtype
+        self.float_dtype = np.float32 if dtype == "compact" else np.float64
+        self.lazy = lazy
+        self.sparse = sparse
+        self.max_workers = max_workers
         self.me_dict = {}
-        self._generate_me_dict(me_df)
+        self._buffers = {}
+        self._memory = MemoryManager(
+            self.me_dict, self._buffers, lazy=lazy, max_resident=max_resident
+        )
+        self._excluded_intervals = None
+        self._excluded_version = 0
+        self._trigger_rates = {}
+        self._batches = []
+        self._batch_of = {}
+        self._path_index = None
+        self._aggregates = {}
 
-    def _generate_me_dict(self, me_df):
+    def _generate_me_dict(self, me_df, data_buffer=None):
         if len(me_df) == 0:
             warnings.warn("Input DataFrame is empty.")
-        mes = list(me_df["me"].unique())
-
-        for me in mes:
-            self.me_dict[me] = {}
-
-            sorted_dfsubset = me_df[me_df["me"] == me].sort_values(by="ls_number")
-            me_id = sorted_dfsubset["me_id"].unique()[0]
-            if me_id in meIDs1D:
-                dim = 1
-            elif me_id in meIDs2D:
-                dim = 2
-            else:
-                raise ValueError("Unrecognized monitoring element id number")
 
-            data_arr = np.array(sorted_dfsubset["data"].to_list())
-            entries = np.array(sorted_dfsubset["entries"].to_list())
+        # Sort once by (me, ls_number) and build every ME from its slice
+        self._columns, self._me_rows = index_me_rows(me_df, data_buffer=data_buffer)
+        num_lss = int(self._columns["ls_number"].max()) if len(me_df) > 0 else 0
+        if not self.lazy:
+            self.mapMEs(self._materialize)
+            self._columns = None
+        self._setNumLSs(num_lss)
 
-            self.me_dict[me]["x_bins"] = np.linspace(
-                sorted_dfsubset["x_min"].iloc[0],
-                sorted_dfsubset["x_max"].iloc[0],
-                int(sorted_dfsubset["x_bin"].iloc[0]),
+    def _setNumLSs(self, num_lss=None):
+        """
+        numLSs is the highest LS number of any ME, computed from the built MEs unless given.
+        """
+        if num_lss is None:
+            num_lss = max(
+                [0]
+                + [
+                    int(me_entry["ls_numbers"][-1])
+                    for me_entry in self.me_dict.values()
+                    if len(me_entry["ls_numbers"]) > 0
+                ]
             )
+        self.numLSs = num_lss
+        self.setExcluded([])
 
-            if dim == 2:
-                self.me_dict[me]["y_bins"] = np.linspace(
-                    sorted_dfsubset["y_min"].iloc[0],
-                    sorted_dfsubset["y_max"].iloc[0],
-                    int(sorted_dfsubset["y_bin"].iloc[0]),
-                )
+    def _addLSNumbers(self, me_entry):
+        if "ls_numbers" not in me_entry:
+            me_entry["ls_numbers"] = np.arange(1, len(me_entry["entries"]) + 1)
 
-            self.me_dict[me]["me_id"] = me_id
-            self.me_dict[me]["dim"] = dim
-            self.me_dict[me]["data"] = data_arr
-            self.me_dict[me]["entries"] = entries
-            # self.me_dict[me]["integral"] = None
-            # self.me_dict[me]["norm"] = None
-            # self.me_dict[me]["trignorm"] = None
-        self._setEmptyLSs()
-        self.excludelumis = []
-        self.numLSs = len(self.getData(self.getMENames()[0]))
+    def _materialize(self, me):
+        start, stop = self._me_rows[me]
+        me_entry = build_me_entry(self._columns, start, stop)
+        # Products dropped on eviction are recomputed on their next access
+        keys = self._memory.popEvictedKeys(me)
+        if keys is not None:
+            me_entry["keys"] = keys
+        self._addME(me, me_entry)
 
-    def __getitem__(self, me):
+    def _addME(self, me, me_entry):
+        self._addLSNumbers(me_entry)
+        if (
+            self.sparse
+            and me_entry["dim"] == 2
+            and not isinstance(me_entry["data"], SparseLSArray)
+        ):
+            me_entry["data"] = SparseLSArray.from_dense(me_entry["data"])
+        if self.dtype == "compact":
+            for key in ["data", "entries"]:
+                me_entry[key] = compact_counts(me_entry[key])
+        # me_entry["integral"] = None
+        # me_entry["norm"] = None
+        # me_entry["trignorm"] = None
+        self.me_dict[me] = me_entry
+        self._setEmptyLSs(mes=[me])
+
+    def _getME(self, me):
+        """
+        Returns the dictionary entry of an ME, building it first in lazy mode and reloading it if it was spilled to disk.
+        """
+        if me not in self.me_dict:
+            if not self.lazy or me not in self._me_rows:
+                raise KeyError(me)
+            self._materialize(me)
+        self._memory.access(me)
         return self.me_dict[me]
 
+    def setMemoryBudget(self, memory_budget, scratch_dir=None):
+        """
+        Bounds the bytes held by the per-ME arrays, spilling the least recently used MEs to a temporary directory under scratch_dir and reading them back on access. Batched and memory-mapped MEs are never spilled. None reloads every ME.
+        """
+        self._memory.setBudget(memory_budget, scratch_dir=scratch_dir)
+        if memory_budget is not None:
+            for me in self.getResident():
+                self._getME(me)
+
+    def getMemoryStats(self):
+        return self._memory.getStats()
+
+    def mapMEs(self, func, mes=None):
+        """
+        Calls func(me) for each ME, all by default, and returns the results as a {me: result} dictionary. Runs on a thread pool when max_workers > 1 (except in lazy mode or with a memory budget, where the resident set is not thread safe).
+        """
+        if mes is None:
+            mes = self.getMENames()
+        if (
+            self.max_workers is None
+            or self.max_workers <= 1
+            or self.lazy
+            or self._memory.memory_budget is not None
+            or len(mes) <= 1
+        ):
+            return {me: func(me) for me in mes}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return dict(zip(mes, executor.map(func, mes)))
+
+    def getResident(self):
+        return list(self.me_dict.keys())
+
+    def __getitem__(self, me):
+        return self._getME(me)
+
     def __len__(self):
-        return len(self.me_dict)
+        return len(self._me_rows)
 
     def getData(self, me, ls=None, type="data"):
         if ls is not None and not isinstance(ls, int):
@@ -65,117 +392,921 @@ class MEData:
         if (ls is not None) and (type == "integral"):
             raise ValueError("Cannot select LS in integrated data.")
 
+        self._refresh(me, type)
         if ls is None:
-            return self.me_dict[me][type]
-        else:
-            return self.me_dict[me][type][ls - 1]
+            return self._getME(me)[type]
+        row = self.getRows(me, ls)
+        if row < 0:
+            raise ValueError(f"LS {ls} is not available for {me}.")
+        return self._getME(me)[type][row]
+
+    def getLSNumbers(self, me):
+        """
+        Sorted LS numbers of the rows of an ME's per-LS arrays.
+        """
+        return self._getME(me)["ls_numbers"]
+
+    def _lsIndex(self, me):
+        """
+        Dense lookup table from LS number to row of an ME, -1 for missing LSs.
+        """
+        me_entry = self._getME(me)
+        if "ls_index" not in me_entry:
+            ls_numbers = me_entry["ls_numbers"]
+            ls_index = np.full(
+                int(ls_numbers[-1]) + 1 if len(ls_numbers) > 0 else 1, -1
+            )
+            ls_index[ls_numbers] = np.arange(len(ls_numbers))
+            me_entry["ls_index"] = ls_index
+        return me_entry["ls_index"]
+
+    def getRows(self, me, ls):
+        """
+        Rows of an ME holding the given LS number or array of LS numbers, -1 for LSs the ME does not have.
+        """
+        ls_index = self._lsIndex(me)
+        ls = np.asarray(ls)
+        valid = (ls >= 0) & (ls < len(ls_index))
+        rows = np.where(valid, ls_index[np.where(valid, ls, 0)], -1)
+        return rows if rows.ndim > 0 else int(rows)
+
+    def hasLS(self, me, ls):
+        return self.getRows(me, ls) >= 0
+
+    def getLSRange(self, me, first, last, type="data"):
+        """
+        LS numbers and per-LS array rows of an ME for the LSs from first to last (inclusive) that it has, as views.
+        """
+        ls_numbers = self.getLSNumbers(me)
+        rows = slice(
+            np.searchsorted(ls_numbers, first, side="left"),
+            np.searchsorted(ls_numbers, last, side="right"),
+        )
+        return ls_numbers[rows], self.getData(me, type=type)[rows]
+
+    def align(self, fill=0, mes=None):
+        """
+        Returns a new MEData in which every ME has one row per LS from 1 to numLSs, with the histograms of LSs an ME is missing set to fill and their entries to 0. Exclusions are kept; derived products are not.
+        """
+        if mes is None:
+            mes = self.getMENames()
+        me_dict = {}
+        for me in mes:
+            me_entry = self._getME(me)
+            rows = me_entry["ls_numbers"] - 1
+            medata = me_entry["data"]
+            if isinstance(medata, SparseLSArray):
+                medata = medata.toarray()
+            data = np.full(
+                (self.numLSs, *medata.shape[1:]),
+                fill,
+                dtype=np.result_type(medata.dtype, np.min_scalar_type(fill)),
+            )
+            data[rows] = medata
+            entries = np.zeros(self.numLSs, dtype=me_entry["entries"].dtype)
+            entries[rows] = me_entry["entries"]
+            me_dict[me] = {
+                key: me_entry[key]
+                for key in ["x_bins", "y_bins", "me_id", "dim"]
+                if key in me_entry
+            }
+            me_dict[me]["data"] = data
+            me_dict[me]["entries"] = entries
+        me_data = MEData.fromMEDict(me_dict, dtype=self.dtype)
+        me_data._setNumLSs(self.numLSs)
+        me_data.setExcluded(self.getExcluded())
+        return me_data
 
     def getNumLSs(self):
         return self.numLSs
 
     def getEntries(self, me):
-        return self.me_dict[me]["entries"]
+        return self._getME(me)["entries"]
 
     def getBins(self, me, dim="x"):
+        me_entry = self._getME(me)
         if dim == "x":
-            return self.me_dict[me]["x_bins"]
-        elif dim == "y" and self.me_dict[me]["dim"] == 2:
-            return self.me_dict[me]["y_bins"]
+            return me_entry["x_bins"]
+        elif dim == "y" and me_entry["dim"] == 2:
+            return me_entry["y_bins"]
         else:
             raise ValueError("Invalid dimension or element is not 2D")
 
     def getDims(self, me):
-        return self.me_dict[me]["dim"]
+        return self._getME(me)["dim"]
 
     def getExcluded(self):
-        return self.excludelumis
+        return (np.flatnonzero(self._excluded_mask) + 1).tolist()
+
+    def _derived(self, me_dict, num_lss):
+        """
+        Wraps per-ME arrays computed from this MEData into a new MEData with the same storage policy.
+        """
+        me_data = MEData.fromMEDict(me_dict, dtype=self.dtype)
+        me_data._setNumLSs(num_lss)
+        return me_data
+
+    def _denseData(self, me):
+        medata = self.getData(me)
+        return medata.toarray() if isinstance(medata, SparseLSArray) else medata
+
+    def rebin(self, x_factor=1, y_factor=1, mes=None):
+        """
+        Returns a new MEData in which every x_factor consecutive x bins (and y_factor y bins of 2D MEs) are summed into one, positioned at their mean.
+        """
+        if mes is None:
+            mes = self.getMENames()
+        me_dict = {}
+        for me in mes:
+            me_entry = self._getME(me)
+            medata = self._denseData(me)
+            dtype = accumulator_dtype(medata.dtype)
+            new_entry = {
+                key: me_entry[key] for key in ["me_id", "dim", "entries", "ls_numbers"]
+            }
+            for dim, factor, axis in [
+                ("x", x_factor, medata.ndim - 1),
+                ("y", y_factor, 1),
+            ]:
+                if dim == "y" and me_entry["dim"] != 2:
+                    continue
+                bins = me_entry[f"{dim}_bins"]
+                starts = np.arange(0, len(bins), factor)
+                counts = np.diff(np.append(starts, len(bins)))
+                medata = np.add.reduceat(medata, starts, axis=axis, dtype=dtype)
+                new_entry[f"{dim}_bins"] = np.add.reduceat(bins, starts) / counts
+            new_entry["data"] = medata
+            me_dict[me] = new_entry
+        me_data = self._derived(me_dict, self.numLSs)
+        me_data.setExcluded(self.getExcluded())
+        return me_data
+
+    def mergeLSs(self, every=None, blocks=None, mes=None):
+        """
+        Returns a new MEData whose LS n is the sum of the n-th group of LSs: every consecutive "every" LSs, or the (first, last) LS ranges given as blocks. Excluded LSs are left out.
+        """
+        if (every is None) == (blocks is None):
+            raise ValueError("Give either every or blocks.")
+        if blocks is not None:
+            blocks = np.asarray(blocks, dtype=np.int64).reshape(-1, 2)
+            order = np.argsort(blocks[:, 0])
+            firsts, lasts = blocks[order, 0], blocks[order, 1]
+            if np.any(firsts[1:] <= lasts[:-1]):
+                raise ValueError("LS blocks should not overlap.")
+            num_groups = len(blocks)
+        else:
+            num_groups = -(-self.numLSs // every)
+        if mes is None:
+            mes = self.getMENames()
+
+        me_dict = {}
+        for me in mes:
+            me_entry = self._getME(me)
+            ls_numbers = self.getLSNumbers(me)
+            if blocks is None:
+                groups = (ls_numbers - 1) // every
+                kept = ~self.getExcludedMask(me)
+            else:
+                idx = np.searchsorted(firsts, ls_numbers, side="right") - 1
+                inside = (idx >= 0) & (ls_numbers <= lasts[np.maximum(idx, 0)])
+                groups = order[np.maximum(idx, 0)]
+                kept = inside & ~self.getExcludedMask(me)
+            groups = groups[kept]
+            # Rows are sorted by LS, so each group is a contiguous run of rows
+            sort = np.argsort(groups, kind="stable")
+            groups = groups[sort]
+            starts = np.flatnonzero(np.diff(groups, prepend=-1))
+            medata = self._denseData(me)[kept][sort]
+            entries = me_entry["entries"][kept][sort]
+            new_entry = {
+                key: me_entry[key]
+                for key in ["me_id", "dim", "x_bins", "y_bins"]
+                if key in me_entry
+            }
+            if len(starts) > 0:
+                new_entry["data"] = np.add.reduceat(
+                    medata, starts, axis=0, dtype=accumulator_dtype(medata.dtype)
+                )
+                new_entry["entries"] = np.add.reduceat(
+                    entries, starts, dtype=accumulator_dtype(entries.dtype)
+                )
+            else:
+                new_entry["data"], new_entry["entries"] = medata, entries
+            new_entry["ls_numbers"] = groups[starts] + 1
+            me_dict[me] = new_entry
+        return self._derived(me_dict, num_groups)
+
+    def getExcludedMask(self, me=None):
+        """
+        Boolean mask of the excluded LSs, indexed by LS number - 1, or over the rows of an ME if given.
+        """
+        if me is None:
+            return self._excluded_mask
+        return self._excluded_mask[self.getLSNumbers(me) - 1]
+
+    def _includedRows(self, me, ndim=1):
+        """
+        Mask of the rows of an ME whose LSs are not excluded, shaped to broadcast against arrays with ndim dimensions.
+        """
+        return ~self.getExcludedMask(me).reshape(-1, *[1] * (ndim - 1))
 
     def getMENames(self):
-        return list(self.me_dict.keys())
+        return list(self._me_rows.keys())
+
+    def getPathIndex(self):
+        """
+        Folder tree over the ME names (see pathutils.MEPathIndex), built on first use and rebuilt when MEs are added.
+        """
+        if self._path_index is None or len(self._path_index) != len(self):
+            self._path_index = MEPathIndex(self.getMENames())
+        return self._path_index
+
+    def selectMEs(self, pattern=None, prefix=None, regex=None):
+        """
+        Names of the MEs under a folder or matching a glob pattern (e.g. "PixelPhase1/Tracks/*/charge_*"), a prefix or a regular expression, to be passed as mes to the other methods.
+        """
+        if [pattern, prefix, regex].count(None) != 2:
+            raise ValueError("Give exactly one of pattern, prefix or regex.")
+        index = self.getPathIndex()
+        if prefix is not None:
+            return index.prefix(prefix)
+        if regex is not None:
+            return index.regex(regex)
+        if GLOB_CHARS.isdisjoint(pattern):
+            return index.subtree(pattern)
+        return index.glob(pattern)
+
+    def getAggregate(self, path, type="data"):
+        """
+        Cached sum of the data, entries, norm, trignorm or integral of all MEs under a folder path, which must share their binning and LSs.
+        """
+        mes = self.getPathIndex().subtree(path)
+        if len(mes) == 0:
+            raise KeyError(path)
+        arrays = [self.getData(me, type=type) for me in mes]
+        ref = mes[0]
+        for me, arr in zip(mes[1:], arrays[1:]):
+            if (
+                arr.shape != arrays[0].shape
+                or self.getDims(me) != self.getDims(ref)
+                or not np.array_equal(self.getBins(me), self.getBins(ref))
+                or (
+                    self.getDims(me) == 2
+                    and not np.array_equal(
+                        self.getBins(me, dim="y"), self.getBins(ref, dim="y")
+                    )
+                )
+                or not np.array_equal(self.getLSNumbers(me), self.getLSNumbers(ref))
+            ):
+                raise ValueError(
+                    f"{me} and {ref} have different binnings or LSs and cannot be summed."
+                )
+
+        key = (
+            self._excluded_version if type not in ["data", "entries"] else None,
+            tuple(self._getME(me).get("keys", {}).get(type) for me in mes),
+        )
+        cached = self._aggregates.get((path, type))
+        if cached is None or cached[0] != key:
+            total = np.zeros(arrays[0].shape, dtype=accumulator_dtype(arrays[0].dtype))
+            for arr in arrays:
+                total += arr.toarray() if isinstance(arr, SparseLSArray) else arr
+            cached = self._aggregates[(path, type)] = (key, total)
+        return cached[1]
 
     def getEmptyLSs(self, me):
-        return self.me_dict[me]["emptyLSs"]
+        return self._getME(me)["emptyLSs"]
 
     def getIntegral(self, me):
-        return self.me_dict[me]["integral"]
+        return self.getData(me, type="integral")
 
     def getNorm(self, me):
-        return self.me_dict[me]["norm"]
+        return self.getData(me, type="norm")
 
     def getTrigNorm(self, me):
-        return self.me_dict[me]["trignorm"]
+        return self.getData(me, type="trignorm")
 
-    def _setEmptyLSs(self, thrshld=0):
-        for me in self.getMENames():
+    def _setEmptyLSs(self, thrshld=0, mes=None):
+        if mes is None:
+            mes = self.getMENames()
+        for me in mes:
             isemptyLSs_arr = np.array(self.getEntries(me)) <= thrshld
-            emptyLSs_idxs = np.where(isemptyLSs_arr)[0]
-            self.me_dict[me]["emptyLSs"] = list(emptyLSs_idxs + 1)
+            self._getME(me)["emptyLSs"] = list(self.getLSNumbers(me)[isemptyLSs_arr])
 
     def setExcluded(self, excludelumis):
-        if len(excludelumis) == 0:
-            self.excludelumis = []
+        """
+        Excludes a list of LSs and (first, last) LS tuples from integration, normalization, trends and plot ranges. Products that depend on the exclusions are recomputed on their next access.
+        """
+        intervals = merge_ls_ranges(excludelumis)
+        if not np.array_equal(intervals, self._excluded_intervals):
+            self._excluded_version += 1
+        self._excluded_intervals = intervals
+        self._excluded_mask = ls_ranges_mask(self._excluded_intervals, self.numLSs)
+
+    def _productKey(self, excluded=True, **inputs):
+        """
+        What a derived product was computed from: its inputs and, if it depends on them, the version of the exclusions.
+        """
+        return (
+            self._excluded_version if excluded else None,
+            tuple(sorted(inputs.items())),
+        )
+
+    def _isCached(self, me, product, key):
+        me_entry = self._getME(me)
+        return product in me_entry and me_entry.get("keys", {}).get(product) == key
+
+    def _setKey(self, me, product, key):
+        self._getME(me).setdefault("keys", {})[product] = key
+
+    def _dropProduct(self, me, product):
+        me_entry = self._getME(me)
+        me_entry.pop(product, None)
+        me_entry.get("keys", {}).pop(product, None)
+
+    def clearCache(self, mes=None):
+        """
+        Drops the derived products (normalizations, integrals and getCached results) of the given MEs, all by default.
+        """
+        if mes is None:
+            mes = self.getMENames()
+        for me in mes:
+            self._memory.popEvictedKeys(me)
+            if me not in self.me_dict:
+                continue
+            for product in list(self.me_dict[me].get("keys", {})):
+                self._dropProduct(me, product)
+            self.me_dict[me].pop("integral_spec", None)
+        for batch in self._batches:
+            for product in ["norm", "trignorm"]:
+                batch.pop(product, None)
+        self._aggregates = {}
+
+    def getCached(self, me, product, compute, **inputs):
+        """
+        Returns a derived product of an ME, calling compute() only if it was never computed or if its inputs (keyword arguments, which must be hashable) or the exclusions changed since. Used by compute_trends, and available to any per-ME analysis.
+        """
+        key = self._productKey(**inputs)
+        if not self._isCached(me, product, key):
+            self._getME(me)[product] = compute()
+            self._setKey(me, product, key)
+        return self._getME(me)[product]
+
+    def _refresh(self, me, product):
+        """
+        Recomputes norm, trignorm or an integral with its original inputs if the exclusions changed since it was computed, or if it was dropped when the ME was evicted.
+        """
+        me_entry = self._getME(me)
+        key = me_entry.get("keys", {}).get(product)
+        if key is None or (
+            product in me_entry and key[0] in (None, self._excluded_version)
+        ):
+            return
+        inputs = dict(key[1])
+        if product == "norm":
+            self.normData(mes=[me])
+        elif product == "trignorm":
+            self.normData(trigger_rate=self._trigger_rates[inputs["rate"]], mes=[me])
+        elif product == "integral" and inputs["intervals"] is None:
+            self.integrateData(norm=inputs["norm"], mes=[me])
+        elif product == "integral":
+            self._integrateIntervals(
+                np.array(inputs["intervals"]).reshape(-1, 2),
+                norm=inputs["norm"],
+                mes=[me],
+            )
+
+    def batchMEs(self, mes=None):
+        """
+        Stacks MEs with identical binning into one (ME x LS x ...) array per batch, so that normData, integrateData and compute_trends process a batch with one NumPy call. Per-ME arrays become views into the stack. Only for dense, non-lazy MEData; append dissolves the batches. Returns the batches as lists of ME names.
+        """
+        if self.lazy or self.sparse:
+            raise ValueError("Batching requires dense, non-lazy MEData.")
+        if mes is None:
+            mes = self.getMENames()
+        # Members must stay in memory for the per-ME arrays to remain views of the stack
+        self._memory.pin(mes)
+        groups = {}
+        for me in mes:
+            me_entry = self._getME(me)
+            binning = (
+                me_entry["dim"],
+                me_entry["data"].shape,
+                np.asarray(me_entry["x_bins"]).tobytes(),
+                np.asarray(me_entry.get("y_bins", [])).tobytes(),
+                me_entry["ls_numbers"].tobytes(),
+            )
+            groups.setdefault(binning, []).append(me)
+
+        for members in groups.values():
+            if len(members) < 2:
+                if members[0] not in self._batch_of:
+                    self._memory.unpin(members)
+                continue
+            batch = {"mes": members, "index": {me: i for i, me in enumerate(members)}}
+            for key in ["data", "entries"]:
+                arrays = [self._getME(me)[key] for me in members]
+                batch[key] = np.stack(arrays).astype(np.result_type(*arrays))
+                for i, me in enumerate(members):
+                    self._getME(me)[key] = batch[key][i]
+            for me in members:
+                if me in self._batch_of:
+                    self._batches.remove(self._batch_of[me])
+                self._batch_of[me] = batch
+            self._batches.append(batch)
+        return self.getBatches()
+
+    def getBatches(self):
+        return [batch["mes"] for batch in self._batches]
+
+    def getBatch(self, me):
+        """
+        Returns the MEs batched together with me and the position of me among them, or None if me is not batched.
+        """
+        batch = self._batch_of.get(me)
+        if batch is None:
             return None
-        ls_to_exclude = []
-        for to_exclude in excludelumis:
-            if isinstance(to_exclude, int):
-                ls_to_exclude.append(to_exclude)
-            elif isinstance(to_exclude, tuple):
-                if (len(to_exclude) != 2) or (to_exclude[0] > to_exclude[1]):
-                    raise Exception(
-                        "Could not expand tuple into range of LSs to exclude. Make sure it has two elements and the first one is larger than the second."
-                    )
-                ls_to_exclude.extend(range(to_exclude[0], to_exclude[1] + 1))
-            else:
-                raise TypeError("Incompatible element type in list of LSs to exclude.")
-        ls_to_exclude = sorted(set(ls_to_exclude))
-        self.excludelumis = ls_to_exclude
+        return batch["mes"], batch["index"][me]
+
+    def getStacked(self, me, type="data"):
+        """
+        Returns the stacked array of data, entries, norm or trignorm shared by the batch of me, or None if me is not batched or if the per-ME arrays of that type are not all up to date views into one stack.
+        """
+        batch = self._batch_of.get(me)
+        if batch is None or type not in batch:
+            return None
+        stack = batch[type]
+        keys = set()
+        for member in batch["mes"]:
+            me_entry = self._getME(member)
+            if me_entry.get(type) is None or me_entry[type].base is not stack:
+                return None
+            keys.add(me_entry.get("keys", {}).get(type))
+        if type in ["data", "entries"]:
+            return stack
+        if len(keys) != 1 or None in keys:
+            return None
+        if keys.pop()[0] != self._excluded_version:
+            return None
+        return stack
+
+    def _staleBatches(self, mes, product, key):
+        """
+        Batches whose MEs are all requested and all lack an up to date product.
+        """
+        mes = set(mes)
+        return [
+            batch
+            for batch in self._batches
+            if all(
+                me in mes and not self._isCached(me, product, key)
+                for me in batch["mes"]
+            )
+        ]
 
-    def normData(self, trigger_rate=None, mes=None):
+    def normData(
+        self, trigger_rate=None, mes=None, out=None, inplace=False, chunk_lss=None
+    ):
         """
-        For normalizing area under curve or by trigger rate.
+        For normalizing area under curve or by trigger rate. Up to date products are not recomputed. out={me: array} gives output buffers (always recomputed), inplace=True reuses the buffer of the previous product and chunk_lss divides that many LSs at a time.
         """
         if mes is None:
             mes = self.getMENames()
         if trigger_rate is None:
-            self._areaNormalize(mes)
+            product, inputs = "norm", {}
         else:
-            self._trigNormalize(trigger_rate, mes)
+            trigger_rate = np.asarray(trigger_rate)
+            rate_key = array_fingerprint(trigger_rate)
+            self._trigger_rates[rate_key] = trigger_rate
+            product, inputs = "trignorm", {"rate": rate_key}
+        key = self._productKey(**inputs)
 
-    def _areaNormalize(self, mes=None):
-        for me in mes:
-            summation = self.getData(me).sum(axis=1, keepdims=True)
-            self.me_dict[me]["norm"] = np.nan_to_num(
-                self.me_dict[me]["data"] / summation, nan=0
-            )
+        if out is None and not inplace and chunk_lss is None:
+            for batch in self._staleBatches(mes, product, key):
+                stack = batch["data"]
+                extra_dims = [1] * (stack.ndim - 2)
+                included = self._includedRows(batch["mes"][0], stack.ndim - 1)[
+                    np.newaxis
+                ]
+                if trigger_rate is None:
+                    divisor = stack.sum(
+                        axis=2, keepdims=True, dtype=accumulator_dtype(stack.dtype)
+                    )
+                    where = included & (divisor != 0)
+                else:
+                    divisor = trigger_rate[
+                        self.getLSNumbers(batch["mes"][0]) - 1
+                    ].reshape(1, -1, *extra_dims)
+                    where = included
+                batch[product] = np.zeros(stack.shape, dtype=self.float_dtype)
+                np.divide(stack, divisor, out=batch[product], where=where)
+                for i, me in enumerate(batch["mes"]):
+                    self._getME(me)[product] = batch[product][i]
+                    self._setKey(me, product, key)
 
-    def _trigNormalize(self, trigger_rate, mes=None):
-        for me in self.getMENames():
+        def normalize(me):
+            buffer = None if out is None else out.get(me)
+            if buffer is None and self._isCached(me, product, key):
+                return
             medata = self.getData(me)
-            dims = self.getDims(me)
-            if dims == 1:
-                self.me_dict[me]["trignorm"] = medata / trigger_rate[:, np.newaxis]
-            elif dims == 2:
-                n = medata.shape[1]
-                m = medata.shape[2]
-                self.me_dict[me]["trignorm"] = medata / np.repeat(
-                    trigger_rate[:, np.newaxis], n * m, axis=1
-                ).reshape(-1, n, m)
+            extra_dims = [1] * (medata.ndim - 1)
+            if trigger_rate is None:
+                divisor = medata.sum(
+                    axis=1, keepdims=True, dtype=accumulator_dtype(medata.dtype)
+                )
+                where = self._includedRows(me, medata.ndim) & (divisor != 0)
             else:
-                raise ValueError("Dimensions can only be 1 or 2.")
+                divisor = trigger_rate[self.getLSNumbers(me) - 1].reshape(
+                    -1, *extra_dims
+                )
+                where = self._includedRows(me, medata.ndim)
+            previous = self._getME(me).get(product)
+            if (
+                buffer is None
+                and inplace
+                and isinstance(previous, np.ndarray)
+                and previous.shape == medata.shape
+                and previous.dtype == self.float_dtype
+                and previous.flags.writeable
+            ):
+                buffer = previous
+            self._getME(me)[product] = self._divideRows(
+                medata, divisor, where, out=buffer, chunk_lss=chunk_lss
+            )
+            self._setKey(me, product, key)
+
+        self.mapMEs(normalize, mes)
 
     def integrateData(self, norm=False, mes=None, exclude=[]):
+        """
+        Integrates over all LSs that are not excluded. Cached like normData.
+        """
         if len(exclude) > 0:
             self.setExcluded(exclude)
+        if mes is None:
+            mes = self.getMENames()
+        key = self._integralKey(norm)
+
+        for batch in self._staleBatches(mes, "integral", key):
+            if any("cumsum" in self._getME(me) for me in batch["mes"]):
+                continue
+            stack = batch["data"]
+            integrals = stack.sum(
+                axis=1,
+                dtype=accumulator_dtype(stack.dtype),
+                where=self._includedRows(batch["mes"][0], stack.ndim - 1)[np.newaxis],
+            )
+            for i, me in enumerate(batch["mes"]):
+                self._setIntegral(me, integrals[i], norm=norm)
+
+        def integrate(me):
+            if self._isCached(me, "integral", key):
+                return
+            if "cumsum" in self._getME(me):
+                intervals = subtract_ls_ranges(
+                    np.array([[1, self.getNumLSs()]]), self._excluded_intervals
+                )
+                self._integrateIntervals(intervals, norm=norm, mes=[me], full_run=True)
+                return
+            medata = self.getData(me)
+            integral = medata.sum(
+                axis=0,
+                dtype=accumulator_dtype(medata.dtype),
+                where=self._includedRows(me, medata.ndim),
+            )
+            self._setIntegral(me, integral, norm=norm)
+
+        self.mapMEs(integrate, mes)
+
+    def _setIntegral(self, me, integral, norm=False, intervals=None):
+        """
+        Stores an integral together with what it covers (the non-excluded LSs, within intervals unless it is None), so append can update it incrementally.
+        """
+        me_entry = self._getME(me)
+        self._setKey(me, "integral", self._integralKey(norm, intervals))
+        me_entry["integral_spec"] = {
+            "raw": integral,
+            "norm": norm,
+            "intervals": intervals,
+        }
+        if norm:
+            integral = np.divide(integral, integral.sum(), dtype=self.float_dtype)
+        me_entry["integral"] = integral
+
+    def _integralKey(self, norm=False, intervals=None):
+        if intervals is None:
+            return self._productKey(norm=norm, intervals=None)
+        return self._productKey(
+            norm=norm, intervals=tuple(map(tuple, intervals.tolist()))
+        )
+
+    def maxData(self, me, type="data"):
+        """
+        Maximum of an ME's per-LS data (or derived product) over the LSs that are not excluded.
+        """
+        medata = self.getData(me, type=type)
+        return medata.max(where=self._includedRows(me, medata.ndim), initial=0)
+
+    def buildCumsum(self, mes=None):
+        """
+        Builds a cumulative sum over LSs for each ME, with a leading row of zeros, so that the integral over any LS interval is the difference of two rows. Once built, integrateData and integrateRanges use it.
+        """
+        if mes is None:
+            mes = self.getMENames()
+        for me in mes:
+            medata = self.getData(me)
+            if isinstance(medata, SparseLSArray):
+                raise ValueError("Cannot build a cumulative sum index for sparse MEs.")
+            cumsum = np.zeros(
+                (len(medata) + 1, *medata.shape[1:]),
+                dtype=accumulator_dtype(medata.dtype),
+            )
+            np.cumsum(medata, axis=0, out=cumsum[1:])
+            self._getME(me)["cumsum"] = cumsum
+
+    def integrateRanges(self, ls_ranges, norm=False, mes=None, exclude=[]):
+        """
+        Integrates over a list of LSs and (first, last) LS tuples, the same syntax setExcluded accepts, minus the LSs in exclude and those excluded with setExcluded. The result replaces the integral returned by getIntegral. Uses (and builds if needed) the cumulative sum index, so only two rows per interval are read.
+        """
+        intervals = subtract_ls_ranges(
+            merge_ls_ranges(ls_ranges), merge_ls_ranges(exclude)
+        )
+        self._integrateIntervals(intervals, norm=norm, mes=mes)
+
+    def _integrateIntervals(self, intervals, norm=False, mes=None, full_run=False):
+        if mes is None:
+            mes = self.getMENames()
+        # The key holds the requested intervals, so that a change of the exclusions recomputes the integral, and LSs appended later inside them are added
+        spec = None if full_run else intervals
+        key = self._integralKey(norm, spec)
+        included = subtract_ls_ranges(intervals, self._excluded_intervals)
+        first = np.maximum(included[:, 0], 1)
+        last = np.minimum(included[:, 1], self.getNumLSs())
+        first, last = first[first <= last], last[first <= last]
+
+        def integrate(me):
+            if self._isCached(me, "integral", key):
+                return
+            medata = self.getData(me)
+            if isinstance(medata, SparseLSArray):
+                # The index would be dense, use a masked sum instead
+                mask = ls_ranges_mask(np.stack([first, last], axis=1), self.numLSs)[
+                    self.getLSNumbers(me) - 1
+                ]
+                integral = medata.sum(
+                    axis=0,
+                    dtype=accumulator_dtype(medata.dtype),
+                    where=mask.reshape(-1, 1, 1),
+                )
+                self._setIntegral(me, integral, norm=norm, intervals=spec)
+                return
+            if "cumsum" not in self._getME(me):
+                self.buildCumsum(mes=[me])
+            cumsum = self._getME(me)["cumsum"]
+            # LS numbers to cumsum rows, so that missing LSs are skipped
+            ls_numbers = self.getLSNumbers(me)
+            integral = (
+                cumsum[np.searchsorted(ls_numbers, last, side="right")]
+                - cumsum[np.searchsorted(ls_numbers, first, side="left")]
+            ).sum(axis=0, dtype=cumsum.dtype)
+            self._setIntegral(me, integral, norm=norm, intervals=spec)
+
+        self.mapMEs(integrate, mes)
+
+    def append(self, me_df, on_duplicate="raise", trigger_rate=None, data_buffer=None):
+        """
+        Ingests new (me, ls_number) rows, e.g. of a live run, into growing buffers, updating integrals, cumulative sums and normalizations for the new rows only. Rows are placed by LS number, so MEs may miss LSs and get them later, as when building from all rows at once. trignorm is kept if trigger_rate covers all LSs, and dropped otherwise. Already ingested LSs raise a ValueError, or replace the stored rows with on_duplicate="overwrite".
+        """
+        if on_duplicate not in ("raise", "overwrite"):
+            raise ValueError('on_duplicate must be either "raise" or "overwrite".')
+        if self.lazy or self.sparse:
+            raise ValueError("Cannot append to lazy or sparse MEData.")
+
+        # Validate the whole batch before touching any stored array
+        columns, me_rows = index_me_rows(me_df, data_buffer=data_buffer)
+        batches = {}
+        for me, (start, stop) in me_rows.items():
+            me_entry = build_me_entry(columns, start, stop)
+            ls_numbers = columns["ls_number"][start:stop].astype(np.int64)
+            keep = np.append(ls_numbers[1:] != ls_numbers[:-1], True)
+            if on_duplicate == "raise" and (
+                not keep.all()
+                or (me in self._me_rows and self.hasLS(me, ls_numbers).any())
+            ):
+                raise ValueError(f"Appended rows contain already ingested LSs of {me}.")
+            if (
+                me in self._me_rows
+                and me_entry["data"].shape[1:] != self.getData(me).shape[1:]
+            ):
+                raise ValueError(
+                    f"Appended histograms of {me} have a different binning."
+                )
+            me_entry["data"] = me_entry["data"][keep]
+            me_entry["entries"] = me_entry["entries"][keep]
+            batches[me] = (me_entry, ls_numbers[keep])
+
+        # Per-ME arrays are resized independently, so batches cannot be kept
+        self._batches = []
+        self._batch_of = {}
+        self._memory.unpin()
+        self._aggregates = {}
+
+        # Bring stale products up to date before updating them incrementally
         for me in self.getMENames():
-            if len(self.getExcluded()) > 0:
-                excluded_indices = [int(x - 1) for x in self.getExcluded() if (x > 0)]
-                data_to_integrate = np.delete(
-                    self.getData(me), excluded_indices, axis=0
+            for product in ["norm", "trignorm", "integral"]:
+                self._refresh(me, product)
+        if trigger_rate is not None:
+            trigger_rate = np.asarray(trigger_rate)
+            rate_key = array_fingerprint(trigger_rate)
+            self._trigger_rates[rate_key] = trigger_rate
+
+        num_lss = max(
+            [self.numLSs] + [int(ls_numbers[-1]) for _, ls_numbers in batches.values()]
+        )
+        for me, (me_entry, ls_numbers) in batches.items():
+            if me not in self._me_rows:
+                self._me_rows[me] = (0, 0)
+                self._addME(
+                    me,
+                    dict(
+                        me_entry,
+                        data=me_entry["data"][:0],
+                        entries=me_entry["entries"][:0],
+                        ls_numbers=ls_numbers[:0],
+                    ),
                 )
-            else:
-                data_to_integrate = self.getData(me)
-            integral = data_to_integrate.sum(axis=0, keepdims=True)[0]
-            if norm:
-                self.me_dict[me]["integral"] = integral / integral.sum()
-            else:
-                self.me_dict[me]["integral"] = integral
+        self.numLSs = num_lss
+        self._excluded_mask = ls_ranges_mask(self._excluded_intervals, num_lss)
+
+        for me in self.getMENames():
+            old_ls_numbers = self.getLSNumbers(me)
+            if me in batches:
+                me_entry, ls_numbers = batches[me]
+                if len(old_ls_numbers) == 0 or ls_numbers[0] > old_ls_numbers[-1]:
+                    merged = np.concatenate([old_ls_numbers, ls_numbers])
+                else:
+                    merged = np.union1d(old_ls_numbers, ls_numbers)
+                self._resizeME(me, merged)
+                rows = np.searchsorted(merged, ls_numbers)
+                self._writeRows(me, rows, me_entry, trigger_rate)
+                self._updateEmptyLSs(me, rows)
+                # Products from getCached cannot be updated row by row
+                for product in list(self._getME(me).get("keys", {})):
+                    if product not in ["norm", "trignorm", "integral"]:
+                        self._dropProduct(me, product)
+            if trigger_rate is None:
+                self._dropProduct(me, "trignorm")
+            elif "trignorm" in self._getME(me):
+                old_key = self._getME(me)["keys"]["trignorm"]
+                old_rate = self._trigger_rates[dict(old_key[1])["rate"]]
+                self._setKey(me, "trignorm", self._productKey(rate=rate_key))
+                # The new rates may also change the rows that were already there
+                if not np.array_equal(
+                    old_rate[old_ls_numbers - 1], trigger_rate[old_ls_numbers - 1]
+                ):
+                    self.normData(
+                        trigger_rate=trigger_rate,
+                        mes=[me],
+                        out={me: self._getME(me)["trignorm"]},
+                    )
+
+    def _resizeME(self, me, ls_numbers):
+        """
+        Moves the per-LS arrays of an ME to the rows of ls_numbers, the sorted union of its LS numbers and the appended ones, inside buffers owned by this MEData, reallocating with doubled capacity when a buffer is full. Rows of new LSs are zero. Rows of the cumulative sum from the first new LS on are left for _writeRows to recompute.
+        """
+        me_entry = self._getME(me)
+        old_len = len(me_entry["ls_numbers"])
+        num_rows = len(ls_numbers)
+        old_rows = np.searchsorted(ls_numbers, me_entry["ls_numbers"])
+        # Appending after the last stored LS, the common case, keeps the rows in place
+        in_place = old_len == 0 or old_rows[-1] == old_len - 1
+        buffers = self._buffers.setdefault(me, {})
+        for key in ["data", "entries", "norm", "trignorm", "cumsum"]:
+            if key not in me_entry:
+                continue
+            arr = me_entry[key]
+            new_len = num_rows + 1 if key == "cumsum" else num_rows
+            buffer = buffers.get(key)
+            if buffer is None or len(buffer) < new_len or buffer.dtype != arr.dtype:
+                buffer = np.zeros(
+                    (max(new_len, 2 * len(arr)), *arr.shape[1:]), dtype=arr.dtype
+                )
+                buffer[: len(arr)] = arr
+                buffers[key] = buffer
+            elif arr is not buffer and arr.base is not buffer:
+                # The array was replaced since the last resize, e.g. recomputed
+                buffer[: len(arr)] = arr
+            if key != "cumsum" and in_place:
+                buffer[old_len:new_len] = 0
+            elif key != "cumsum":
+                old = buffer[:old_len].copy()
+                buffer[:new_len] = 0
+                buffer[old_rows] = old
+            me_entry[key] = buffer[:new_len]
+
+        self._me_rows[me] = (0, num_rows)
+        me_entry["ls_numbers"] = ls_numbers
+        me_entry.pop("ls_index", None)
+
+    def _writeRows(self, me, rows, me_entry, trigger_rate=None):
+        me_stored = self._getME(me)
+        new_data = me_entry["data"]
+        if self.dtype == "compact":
+            new_data = compact_counts(new_data)
+        for key, new in [("data", new_data), ("entries", me_entry["entries"])]:
+            # Upcast the stored counts if the new ones do not fit
+            dtype = np.promote_types(me_stored[key].dtype, new.dtype)
+            if dtype != me_stored[key].dtype:
+                me_stored[key] = me_stored[key].astype(dtype)
+                self._buffers[me][key] = me_stored[key]
+
+        ls_numbers = me_stored["ls_numbers"][rows]
+        old_data = me_stored["data"][rows].copy()
+        me_stored["data"][rows] = new_data
+        me_stored["entries"][rows] = me_entry["entries"]
+
+        extra_dims = [1] * (new_data.ndim - 1)
+        included = ~self._excluded_mask[ls_numbers - 1]
+        if "integral_spec" in me_stored:
+            spec = me_stored["integral_spec"]
+            covered = included
+            if spec["intervals"] is not None:
+                covered = (
+                    included
+                    & ls_ranges_mask(spec["intervals"], self.numLSs)[ls_numbers - 1]
+                )
+            raw_dtype = spec["raw"].dtype
+            delta = new_data[covered].sum(axis=0, dtype=raw_dtype) - old_data[
+                covered
+            ].sum(axis=0, dtype=raw_dtype)
+            self._setIntegral(
+                me,
+                spec["raw"] + delta,
+                norm=spec["norm"],
+                intervals=spec["intervals"],
+            )
+        if "cumsum" in me_stored:
+            first = rows[0]
+            cumsum = me_stored["cumsum"]
+            np.cumsum(me_stored["data"][first:], axis=0, out=cumsum[first + 1 :])
+            cumsum[first + 1 :] += cumsum[first]
+        if "norm" in me_stored:
+            summation = new_data.sum(
+                axis=1, keepdims=True, dtype=accumulator_dtype(new_data.dtype)
+            )
+            me_stored["norm"][rows] = self._divideRows(
+                new_data,
+                summation,
+                included.reshape(-1, *extra_dims) & (summation != 0),
+            )
+        if "trignorm" in me_stored and trigger_rate is not None:
+            rates = np.asarray(trigger_rate)[ls_numbers - 1]
+            me_stored["trignorm"][rows] = self._divideRows(
+                new_data,
+                rates.reshape(-1, *extra_dims),
+                included.reshape(-1, *extra_dims),
+            )
+
+    def _updateEmptyLSs(self, me, rows, thrshld=0):
+        """
+        Updates the empty LSs of an ME for the given rows only.
+        """
+        me_entry = self._getME(me)
+        ls_numbers = me_entry["ls_numbers"][rows]
+        old_empty = np.array(me_entry["emptyLSs"], dtype=np.int64)
+        unchanged = old_empty[~np.isin(old_empty, ls_numbers)]
+        new_empty = ls_numbers[me_entry["entries"][rows] <= thrshld]
+        me_entry["emptyLSs"] = list(np.union1d(unchanged, new_empty))
+
+    def _divideRows(self, medata, divisor, where, out=None, chunk_lss=None):
+        """
+        Divides per-LS histograms by a divisor that broadcasts against them, leaving zeros where "where" is False, into out (allocated if None), chunk_lss LSs at a time.
+        """
+        if isinstance(medata, SparseLSArray):
+            if out is not None:
+                raise ValueError("Output buffers are not supported for sparse MEs.")
+            return medata.divide(divisor, where=where, dtype=self.float_dtype)
+        reused = out is not None
+        if not reused:
+            out = np.zeros(medata.shape, dtype=self.float_dtype)
+        elif out.shape != medata.shape:
+            raise ValueError(
+                f"Output buffer has shape {out.shape} instead of {medata.shape}."
+            )
+
+        def rows_of(arr, rows):
+            # Per-LS operands are sliced along with the data, broadcast ones are not
+            return arr[rows] if np.ndim(arr) > 0 and len(arr) == len(medata) else arr
+
+        step = max(len(medata) if chunk_lss is None else chunk_lss, 1)
+        for start in range(0, len(medata), step):
+            rows = slice(start, start + step)
+            if reused:
+                out[rows] = 0
+            np.divide(
+                medata[rows],
+                rows_of(divisor, rows),
+                out=out[rows],
+                where=rows_of(where, rows),
+            )
+        return out
@@ -0,0 +1,238 @@
+import numpy as np
+import warnings
+from dqmexplore.medata import MEData
+from dqmexplore.utils.datautils import (
+    index_me_rows,
+    build_me_entry,
+    compact_counts,
+    accumulator_dtype,
+)
+
+
+class MultiRunMEData:
+    def __init__(self, me_df, dtype=None):
+        """
+        Holds the same MEs for many runs. Each ME is stored as one zero-padded (run x LS x bins) or (run x LS x y x x) array, where LS i of a run sits at position i - 1, so integrals, normalizations and trends for all runs are single vectorized calls.
+
+        me_df is a DataFrame (or pyarrow Table) with a run_number column, e.g. the output of dials.h1d.list_all(...) for several runs. dtype follows the same policy as MEData.
+        """
+        if dtype not in (None, "compact"):
+            raise ValueError('dtype must be either None or "compact".')
+        self.dtype = dtype
+        self.float_dtype = np.float32 if dtype == "compact" else np.float64
+        self.me_dict = {}
+        self._generate_me_dict(me_df)
+
+    @classmethod
+    def fromMEData(cls, me_datas, dtype=None):
+        """
+        Stacks MEData objects given as a {run_number: MEData} dictionary. Only the MEs present in every run are kept.
+        """
+        runs = np.array(sorted(me_datas.keys()))
+        mes = [
+            me
+            for me in me_datas[runs[0]].getMENames()
+            if all(me in me_datas[run].getMENames() for run in runs)
+        ]
+        multirun = cls.__new__(cls)
+        multirun.dtype = dtype
+        multirun.float_dtype = np.float32 if dtype == "compact" else np.float64
+        multirun.me_dict = {}
+        multirun.runs = runs
+        multirun.numLSs = np.array([me_datas[run].getNumLSs() for run in runs])
+
+        for me in mes:
+            ref = me_datas[runs[0]]
+            multirun.me_dict[me] = {
+                key: ref[me][key]
+                for key in ["x_bins", "y_bins", "me_id", "dim"]
+                if key in ref[me]
+            }
+            multirun._setPadded(
+                me,
+                [me_datas[run].getData(me) for run in runs],
+                [me_datas[run].getEntries(me) for run in runs],
+                [me_datas[run].getLSNumbers(me) for run in runs],
+            )
+        return multirun
+
+    def _generate_me_dict(self, me_df):
+        if len(me_df) == 0:
+            warnings.warn("Input DataFrame is empty.")
+
+        # Sort once by (me, run_number, ls_number) and scatter every ME into its padded array
+        columns, me_rows = index_me_rows(me_df, keys=("run_number", "ls_number"))
+        self.runs = np.unique(columns["run_number"])
+        run_idxs = np.searchsorted(self.runs, columns["run_number"])
+        self.numLSs = np.zeros(len(self.runs), dtype=np.int64)
+        np.maximum.at(self.numLSs, run_idxs, columns["ls_number"])
+
+        for me, (start, stop) in me_rows.items():
+            me_entry = build_me_entry(columns, start, stop)
+            rows = (run_idxs[start:stop], columns["ls_number"][start:stop] - 1)
+            data = np.zeros(
+                (len(self.runs), self.numLSs.max(), *me_entry["data"].shape[1:]),
+                dtype=me_entry["data"].dtype,
+            )
+            data[rows] = me_entry["data"]
+            entries = np.zeros(data.shape[:2], dtype=me_entry["entries"].dtype)
+            entries[rows] = me_entry["entries"]
+            me_entry["data"], me_entry["entries"] = data, entries
+            # The padded layout replaces the per-ME LS numbers
+            del me_entry["ls_numbers"]
+            self.me_dict[me] = me_entry
+            self._compact(me)
+
+    def _setPadded(self, me, datas, entries, ls_numbers):
+        """
+        Places the rows of each run at their LS number - 1, leaving the LSs a run is missing empty.
+        """
+        data = np.zeros(
+            (len(datas), self.numLSs.max(), *datas[0].shape[1:]), dtype=datas[0].dtype
+        )
+        padded_entries = np.zeros(data.shape[:2], dtype=entries[0].dtype)
+        for i, (run_data, run_entries, run_lss) in enumerate(
+            zip(datas, entries, ls_numbers)
+        ):
+            data[i, run_lss - 1] = run_data
+            padded_entries[i, run_lss - 1] = run_entries
+        self.me_dict[me]["data"] = data
+        self.me_dict[me]["entries"] = padded_entries
+        self._compact(me)
+
+    def _compact(self, me):
+        if self.dtype == "compact":
+            for key in ["data", "entries"]:
+                self.me_dict[me][key] = compact_counts(self.me_dict[me][key])
+
+    def __getitem__(self, me):
+        return self.me_dict[me]
+
+    def __len__(self):
+        return len(self.me_dict)
+
+    def getRuns(self):
+        return self.runs.tolist()
+
+    def getMENames(self):
+        return list(self.me_dict.keys())
+
+    def getNumLSs(self, run=None):
+        if run is None:
+            return self.numLSs
+        return self.numLSs[self._runIdx(run)]
+
+    def getDims(self, me):
+        return self.me_dict[me]["dim"]
+
+    def getBins(self, me, dim="x"):
+        if dim == "x":
+            return self.me_dict[me]["x_bins"]
+        elif dim == "y" and self.me_dict[me]["dim"] == 2:
+            return self.me_dict[me]["y_bins"]
+        else:
+            raise ValueError("Invalid dimension or element is not 2D")
+
+    def getData(self, me, run=None, type="data"):
+        """
+        Returns the padded (run x LS x bins) array, or the unpadded array of a single run. Integrals are (run x bins).
+        """
+        data = self.me_dict[me][type]
+        if run is None:
+            return data
+        idx = self._runIdx(run)
+        return data[idx] if type == "integral" else data[idx, : self.numLSs[idx]]
+
+    def getEntries(self, me, run=None):
+        return self.getData(me, run=run, type="entries")
+
+    def getEmptyLSs(self, me, thrshld=0):
+        empty = (self.me_dict[me]["entries"] <= thrshld) & self._validLSs()
+        return {
+            run: list(np.flatnonzero(row) + 1) for run, row in zip(self.runs, empty)
+        }
+
+    def getExcludedMask(self, me=None):
+        """
+        Mask of the padding positions, i.e. LSs beyond the end of each run. It is the same for every ME.
+        """
+        return ~self._validLSs()
+
+    def getRun(self, run):
+        """
+        Returns a single run as an MEData, with views into the stacked arrays, for the plotting functions.
+        """
+        me_dict = {}
+        for me, me_entry in self.me_dict.items():
+            me_dict[me] = {
+                key: me_entry[key]
+                for key in ["x_bins", "y_bins", "me_id", "dim"]
+                if key in me_entry
+            }
+            me_dict[me]["data"] = self.getData(me, run=run)
+            me_dict[me]["entries"] = self.getEntries(me, run=run)
+        return MEData.fromMEDict(me_dict, dtype=self.dtype)
+
+    def _runIdx(self, run):
+        idx = np.searchsorted(self.runs, run)
+        if idx >= len(self.runs) or self.runs[idx] != run:
+            raise KeyError(run)
+        return idx
+
+    def _validLSs(self):
+        return np.arange(self.numLSs.max(initial=0)) < self.numLSs[:, np.newaxis]
+
+    def _padRates(self, trigger_rate):
+        """
+        Accepts trigger rates as a {run_number: array} dictionary or a (run x LS) array.
+        """
+        if isinstance(trigger_rate, dict):
+            rates = np.ones(self._validLSs().shape)
+            for i, run in enumerate(self.runs):
+                rates[i, : len(trigger_rate[run])] = trigger_rate[run]
+            return rates
+        return np.asarray(trigger_rate)
+
+    def normData(self, trigger_rate=None, mes=None):
+        """
+        For normalizing area under curve or by trigger rate, for all runs at once.
+        """
+        if mes is None:
+            mes = self.getMENames()
+        valid = self._validLSs()
+        rates = None if trigger_rate is None else self._padRates(trigger_rate)
+        for me in mes:
+            medata = self.getData(me)
+            extra_dims = [1] * (medata.ndim - 2)
+            out = np.zeros(medata.shape, dtype=self.float_dtype)
+            if rates is None:
+                # Same axis as MEData.normData: the first axis after the LSs
+                summation = medata.sum(
+                    axis=2, keepdims=True, dtype=accumulator_dtype(medata.dtype)
+                )
+                np.divide(medata, summation, out=out, where=summation != 0)
+                self.me_dict[me]["norm"] = out
+            else:
+                np.divide(
+                    medata,
+                    rates.reshape(*rates.shape, *extra_dims),
+                    out=out,
+                    where=valid.reshape(*valid.shape, *extra_dims),
+                )
+                self.me_dict[me]["trignorm"] = out
+
+    def integrateData(self, norm=False, mes=None):
+        """
+        Integrates over LSs, giving a (run x bins) array per ME.
+        """
+        if mes is None:
+            mes = self.getMENames()
+        for me in mes:
+            medata = self.getData(me)
+            integral = medata.sum(axis=1, dtype=accumulator_dtype(medata.dtype))
+            if norm:
+                summation = integral.sum(
+                    axis=tuple(range(1, integral.ndim)), keepdims=True
+                )
+                integral = np.divide(integral, summation, dtype=self.float_dtype)
+            self.me_dict[me]["integral"] = integral
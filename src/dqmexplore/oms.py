@@ -1,22 +1,25 @@
 import numpy as np
 import plotly.graph_objects as go
-from cmsdials.filters import OMSFilter, OMSPage
-from dqmexplore.utils.datautils import makeDF
+from cmsdials.filters import OMSFilter
+from dqmexplore.utils.omsutils import fetch_frame
 
 
-def get_rate(dials, runnb, dataset_name="ZeroBias", extrafilters=[]):
+def get_rate(
+    dials, runnb, dataset_name="ZeroBias", extrafilters=[], cache=None, executor=None
+):
+    """
+    Trigger rate of a dataset per LS of a run.
+    """
     filters = [
         OMSFilter(attribute_name="run_number", value=runnb, operator="EQ"),
         OMSFilter(attribute_name="dataset_name", value=dataset_name, operator="EQ"),
     ]
 
-    data = dials.oms.query(
-        endpoint="datasetrates",
-        filters=filters,
-        pages=[OMSPage(attribute_name="limit", value=5000)],
-    )
+    # All pages, long runs have more LSs than fit in one
+    def fetch():
+        return fetch_frame(dials, "datasetrates", filters, executor=executor)
 
-    data_df = makeDF(data)
+    data_df = fetch() if cache is None else cache.fetch("datasetrates", filters, fetch)
     data_df.sort_values(by="last_lumisection_number", inplace=True)
 
     return data_df["rate"].to_numpy()
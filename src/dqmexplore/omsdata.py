@@ -1,25 +1,41 @@
 import pandas as pd
 from cmsdials.filters import OMSFilter, OMSPage
-import dask
-from dask import delayed
-from dqmexplore.utils.datautils import makeDF
+import time
+import warnings
+from dqmexplore.utils.omsutils import (
+    OMS_PAGE_LIMIT,
+    group_runs,
+    query_runs,
+    iter_runs,
+    run_range_filters,
+)
+from dqmexplore.utils.fetchutils import FetchExecutor, FetchResult
+
 
 class OMSData:
-    def __init__(self, dials):
+    def __init__(self, dials, cache=None, executor=None):
+        """
+        cache is an optional cacheutils.ResponseCache keeping fetched data on disk across sessions. Data of runs that ended (according to the end_time of the runs endpoint) never expires.
+
+        executor is the fetchutils.FetchExecutor bounding the concurrency and rate of the OMS requests and retrying transient errors, a default FetchExecutor() if None. Share one executor between objects for common limits.
+        """
         self.dials = dials
-        self.runfilters = [] # List of filters for runs
-        self.filters = [] # List of other types of filters (e.g. max num lss)
+        self.cache = cache
+        self.executor = executor if executor is not None else FetchExecutor()
+        self.timings = {}
+        self.runfilters = []  # List of filters for runs
+        self.filters = []  # List of other types of filters (e.g. max num lss)
         self.endpoints = [
             "runs",
             "runkeys",
-            "l1configurationkey", # Not working
+            "l1configurationkey",  # Not working
             "l1algorithmtriggers",
             "hltconfigdata",
-            "deadtime", # 
+            "deadtime",  #
             "daqreadouts",
-            "fill", #
-            "l1triggerrate", # Not working
-            "lumisections"
+            "fill",  #
+            "l1triggerrate",  # Not working
+            "lumisections",
         ]
         self._resetDataDict()
 
@@ -34,10 +50,10 @@ class OMSData:
 
     def _resetFilters(self):
         self.filters = []
-        
+
     def _resetRunFilters(self):
         self.runfilters = []
-        
+
     def getEndpoints(self):
         return self.endpoints
 
@@ -49,75 +65,238 @@ class OMSData:
         for runFilter in self.runfilters:
             runnbs.append(runFilter.value)
         return runnbs
-        
+
     def getFilters(self):
         return self.filters
 
-    def getData(self, endpoint="runs"):
-        return self._data[endpoint]
+    def getData(self, endpoint="runs", run=None):
+        """
+        Returns the fetched data of an endpoint, for all runs or only for run.
+        """
+        df = self._data[endpoint]
+        if run is None or df is None:
+            return df
+        return df[df["run_number"] == run]
 
     def getAvailFtrs(self, which="all"):
         if which == "all":
-            return {key: df.columns.to_list() if isinstance(df, pd.DataFrame) else None for key, df in self._data.items()}
+            return {
+                key: df.columns.to_list() if isinstance(df, pd.DataFrame) else None
+                for key, df in self._data.items()
+            }
         elif which == "numerical":
-            return {key: df.select_dtypes(include=[int, float]).columns.to_list() if isinstance(df, pd.DataFrame) else None for key, df in self._data.items()}
+            return {
+                key: (
+                    df.select_dtypes(include=[int, float]).columns.to_list()
+                    if isinstance(df, pd.DataFrame)
+                    else None
+                )
+                for key, df in self._data.items()
+            }
         elif which == "bools":
-            return {key: df.select_dtypes(include=[bool]).columns.to_list() if isinstance(df, pd.DataFrame) else None for key, df in self._data.items()}
+            return {
+                key: (
+                    df.select_dtypes(include=[bool]).columns.to_list()
+                    if isinstance(df, pd.DataFrame)
+                    else None
+                )
+                for key, df in self._data.items()
+            }
         else:
             return None
-        
+
     def setRuns(self, runnbs: list, keep_prev=True):
         if keep_prev == False:
             self._resetRunFilters()
         for runnb in runnbs:
             self.runfilters.append(
-                OMSFilter(
-                    attribute_name="run_number", 
-                    value=runnb,
-                    operator="EQ"
-                )
+                OMSFilter(attribute_name="run_number", value=runnb, operator="EQ")
             )
-            
+
     def setFilters(self, filters: dict, keep_prev=True):
         if keep_prev == False:
             self._resetFilters()
         for filter in filters:
             self.filters.append(OMSFilter(**dict))
 
-    def fetchData(self, endpoint="runs", keep_prev=True):
+    def fetchData(
+        self,
+        endpoint="runs",
+        keep_prev=True,
+        max_gap=10,
+        page_limit=OMS_PAGE_LIMIT,
+        max_workers=4,
+    ):
         """
-        Fetches data from OMS endpoints using Dask for parallel execution.
+        Fetches data from OMS endpoints, running the requests on the executor.
+
+        The runs set with setRuns are grouped into run ranges (see omsutils.group_runs), each fetched with one GE/LE query, so that runs separated by at most max_gap other run numbers cost a single request. max_gap=None sends one request per run. Results larger than page_limit records are fetched page by page, with the pages after the first requested on max_workers threads.
+
+        Returns a fetchutils.FetchResult with the data of each (first, last) run range as results. Its failures map the runs that could not be fetched (after retries) to their errors, which are also reported as a warning. A range failing with a non-transient error is split until the failing runs are isolated.
+        """
+        return self.fetchAll(
+            [endpoint],
+            keep_prev=keep_prev,
+            max_gap=max_gap,
+            page_limit=page_limit,
+            max_workers=max_workers,
+        )[endpoint]
+
+    def fetchAll(
+        self,
+        endpoints,
+        keep_prev=True,
+        max_gap=10,
+        page_limit=OMS_PAGE_LIMIT,
+        max_workers=4,
+    ):
+        """
+        Fetches several endpoints for the runs set with setRuns, scheduling the requests of every (endpoint, run range) pair at once on the executor instead of one endpoint after the other. Each run range is kept as soon as it arrives, and the data of each endpoint is assembled in run order at the end. The options are those of fetchData.
+
+        Returns a {endpoint: FetchResult} dictionary. getTimings then reports per endpoint the number of run ranges, the seconds until its last range arrived (wall) and the summed durations of its ranges (busy).
         """
         if not keep_prev:
-            self._resetDataDict(endpoint=endpoint)
-    
-        @delayed
-        def fetch_single_filter(runFilter):
-            try:
-                query_result = self.dials.oms.query(endpoint=endpoint, filters=[runFilter])
-                if query_result:
-                    df = makeDF(query_result)
-    
-                    # Specific indexing based on endpoint
-                    if endpoint == "runs":
-                        df["run_number_idx"] = df["run_number"]
-                        df.set_index("run_number_idx", inplace=True)
-                        df.index.name = "run_number"
-                    elif endpoint == "lumisections":
-                        df["run_number_idx"] = df["run_number"]
-                        df["lumisection"] = df["lumisection_number"]
-                        df.set_index(["run_number_idx", "lumisection"], inplace=True)
-                        df.index.names = ["run_number", "lumisection"]
-                    return df
-            except Exception as e:
-                print(f"WARNING: Unable to fetch data for filter {runFilter}: {e}")
-                return None
-    
-        tasks = [fetch_single_filter(runFilter) for runFilter in self.runfilters]
-        results = dask.compute(*tasks)
-        for df in results:
+            for endpoint in endpoints:
+                self._resetDataDict(endpoint=endpoint)
+
+        groups = group_runs(self.getRunnbs(), max_gap=max_gap)
+        tasks = [(endpoint, runs) for endpoint in endpoints for runs in groups]
+        fetch_results = {endpoint: FetchResult() for endpoint in endpoints}
+        frames = {endpoint: {} for endpoint in endpoints}
+        self.timings = {
+            endpoint: {"ranges": len(groups), "wall": 0.0, "busy": 0.0}
+            for endpoint in endpoints
+        }
+
+        start = time.perf_counter()
+        for (endpoint, runs), result, exception, seconds in self.executor.as_completed(
+            lambda task: self._fetchRunGroup(
+                *task, page_limit=page_limit, max_workers=max_workers
+            ),
+            tasks,
+            keys=[(endpoint, tuple(runs)) for endpoint, runs in tasks],
+        ):
+            first, last = runs[0], runs[-1]
+            df, failures = (
+                (None, {run: exception for run in runs})
+                if exception is not None
+                else result
+            )
+            fetch_results[endpoint].results[(first, last)] = df
+            fetch_results[endpoint].failures.update(failures)
             if df is not None:
-                if self._data[endpoint] is None:
-                    self._data[endpoint] = df
-                else:
-                    self._data[endpoint] = pd.concat([self._data[endpoint], df])    
\ No newline at end of file
+                frames[endpoint][(first, last)] = df
+            fetch_results[endpoint].durations[(first, last)] = seconds
+            self.timings[endpoint]["busy"] += seconds
+            self.timings[endpoint]["wall"] = time.perf_counter() - start
+
+        for endpoint in endpoints:
+            dfs = [
+                frames[endpoint][(runs[0], runs[-1])]
+                for runs in groups
+                if (runs[0], runs[-1]) in frames[endpoint]
+            ]
+            if self._data[endpoint] is not None:
+                dfs.insert(0, self._data[endpoint])
+            if len(dfs) > 0:
+                self._data[endpoint] = pd.concat(dfs)
+            if not fetch_results[endpoint].ok:
+                warnings.warn(
+                    f"Unable to fetch {endpoint} for runs "
+                    + ", ".join(
+                        f"{run} ({e})"
+                        for run, e in sorted(fetch_results[endpoint].failures.items())
+                    )
+                )
+        if self.cache is not None and "runs" in endpoints:
+            # The other endpoints were cached before the end times of their runs were known
+            for runs in groups:
+                if not self._isClosed(runs):
+                    continue
+                for endpoint in endpoints:
+                    if endpoint != "runs" and (runs[0], runs[-1]) in frames[endpoint]:
+                        self.cache.mark_closed(
+                            endpoint, run_range_filters(runs[0], runs[-1])
+                        )
+        return fetch_results
+
+    def getTimings(self):
+        return self.timings
+
+    def _fetchRunGroup(self, endpoint, runs, page_limit=OMS_PAGE_LIMIT, max_workers=4):
+        """
+        Returns the indexed data of a run range (None if empty) and a {run: exception} dictionary of the runs that failed. On a non-transient error the range is split in halves, so that a broken run does not take the others down with it.
+        """
+        try:
+            df = query_runs(
+                self.dials,
+                endpoint,
+                runs,
+                page_limit=page_limit,
+                max_workers=max_workers,
+                cache=self.cache,
+                closed=lambda df: self._isClosed(
+                    runs, df if endpoint == "runs" else None
+                ),
+                executor=self.executor,
+            )
+        except Exception as e:
+            if len(runs) == 1 or self.executor.transient(e):
+                return None, {run: e for run in runs}
+            half = len(runs) // 2
+            parts = [
+                self._fetchRunGroup(
+                    endpoint, part, page_limit=page_limit, max_workers=max_workers
+                )
+                for part in [runs[:half], runs[half:]]
+            ]
+            dfs = [df for df, _ in parts if df is not None]
+            return (pd.concat(dfs) if len(dfs) > 0 else None), {
+                **parts[0][1],
+                **parts[1][1],
+            }
+        if df is not None and len(df) > 0:
+            return self._indexDF(endpoint, df), {}
+        return None, {}
+
+    def iterData(
+        self, endpoint="runs", max_gap=10, page_limit=OMS_PAGE_LIMIT, max_workers=4
+    ):
+        """
+        Generator version of fetchData: yields one DataFrame per page of page_limit records, indexed like the fetched data, without storing or caching them. Run ranges are fetched one after the other.
+        """
+        for runs in group_runs(self.getRunnbs(), max_gap=max_gap):
+            for df in iter_runs(
+                self.dials,
+                endpoint,
+                runs,
+                page_limit=page_limit,
+                max_workers=max_workers,
+                executor=self.executor,
+            ):
+                if len(df) > 0:
+                    yield self._indexDF(endpoint, df)
+
+    def _isClosed(self, runs, runs_df=None):
+        """
+        Whether all runs have ended according to the runs data fetched so far (or runs_df).
+        """
+        if runs_df is None:
+            runs_df = self._data["runs"]
+        if runs_df is None or "end_time" not in runs_df.columns:
+            return False
+        ended = runs_df.loc[runs_df["end_time"].notna(), "run_number"]
+        return set(runs) <= set(ended)
+
+    def _indexDF(self, endpoint, df):
+        # Specific indexing based on endpoint
+        if endpoint == "runs":
+            df["run_number_idx"] = df["run_number"]
+            df.set_index("run_number_idx", inplace=True)
+            df.index.name = "run_number"
+        elif endpoint == "lumisections":
+            df["run_number_idx"] = df["run_number"]
+            df["lumisection"] = df["lumisection_number"]
+            df.set_index(["run_number_idx", "lumisection"], inplace=True)
+            df.index.names = ["run_number", "lumisection"]
+        return df
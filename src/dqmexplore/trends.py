@@ -2,46 +2,103 @@ import plotly.graph_objects as go
 import numpy as np
 import pandas as pd
 from dqmexplore.utils.datautils import makeDF
+from dqmexplore.medata import MEData
 
 
 def compute_trends(medata, trigger_rates=None):
-    def compute_avg(histbins, x_bins):
-        weighted_sums = np.sum(histbins * x_bins, axis=1)
-        sum_of_weights = np.sum(histbins, axis=1)
+    """
+    Per-LS statistics of each 1D ME. Works on MEData and on MultiRunMEData, where every statistic is a (run x LS) array. On MEData the statistics are cached per ME, only recomputed when the trigger rates or the exclusions change, and computed in parallel if its max_workers is set.
+    """
+    if trigger_rates is not None:
+        to_analyze = "trignorm"
+        medata.normData(trigger_rate=trigger_rates)
+    else:
+        to_analyze = "data"
+
+    if not isinstance(medata, MEData):
+        return {
+            me: _compute_me_trends(medata, me, to_analyze) for me in medata.getMENames()
+        }
+
+    # Statistics of whole batches of same-binning MEs, filled on first use
+    batch_stats = {}
+
+    def cached_trends(me):
+        me_trends = medata.getCached(
+            me,
+            "trends",
+            lambda: _compute_me_trends(medata, me, to_analyze, batch_stats),
+            source=to_analyze,
+            source_key=medata[me].get("keys", {}).get(to_analyze),
+        )
+        # Shallow copy, so that plot_trends(norm=True) leaves the cache intact
+        return dict(me_trends)
+
+    return medata.mapMEs(cached_trends)
+
+
+def _compute_stats(histbins, x_bins, excluded):
+    """
+    Statistics over the last axis of histbins, which may have leading ME and LS axes.
+    """
+
+    def compute_avg(histbins, x_bins, sum_of_weights):
+        weighted_sums = histbins @ x_bins
         x_avg = np.nan_to_num(weighted_sums / sum_of_weights, nan=0)
         return x_avg
 
-    def compute_std(histbins, x_bins, x_avg):
-        sqrd_devs = np.sum(histbins * (x_bins - x_avg[:, np.newaxis]) ** 2, axis=1)
-        sum_of_weights = np.sum(histbins, axis=1)
+    def compute_std(histbins, x_bins, x_avg, sum_of_weights):
+        sqrd_devs = np.sum(histbins * (x_bins - x_avg[..., np.newaxis]) ** 2, axis=-1)
         variance = np.nan_to_num(sqrd_devs / sum_of_weights, nan=0)
         std_dev = np.sqrt(variance)
         return std_dev
 
-    if trigger_rates is not None:
-        to_analyze = "trignorm"
-        medata.normData(trigger_rate=trigger_rates)
-    else:
-        to_analyze = "data"
+    stats = {}
+    sum_of_weights = np.sum(histbins, axis=-1)
+    stats["mean"] = compute_avg(histbins, x_bins, sum_of_weights)  # e.g. mean charge
+    stats["stdev"] = compute_std(
+        histbins, x_bins, stats["mean"], sum_of_weights
+    )  # e.g. std of charge
+    stats["mpv"] = x_bins[np.argmax(histbins, axis=-1)]  # e.g. mpv charge
+    stats["max"] = np.max(histbins, axis=-1)
+    stats["std_err_on_mean"] = stats["stdev"] / np.sqrt(histbins.shape[-1])
 
-    trends = {}
+    # Excluded LSs are left as gaps in the trends
+    for stat in stats:
+        stats[stat] = np.where(excluded, np.nan, stats[stat])
+    return stats
 
-    for me in medata.getMENames():
-        trends[me] = {}
+
+def _compute_me_trends(medata, me, to_analyze, batch_stats=None):
+    x_bins = medata.getBins(me, dim="x")
+    excluded = medata.getExcludedMask(me)
+    me_trends = None
+    batch = None if batch_stats is None else medata.getBatch(me)
+    if batch is not None:
+        members, i = batch
+        if members[0] not in batch_stats:
+            stack = medata.getStacked(me, type=to_analyze)
+            batch_stats[members[0]] = (
+                None if stack is None else _compute_stats(stack, x_bins, excluded)
+            )
+        if batch_stats[members[0]] is not None:
+            me_trends = {
+                stat: values[i] for stat, values in batch_stats[members[0]].items()
+            }
+    if me_trends is None:
         histbins = medata.getData(me, type=to_analyze)
-        x_bins = medata.getBins(me, dim="x")
-        trends[me]["mean"] = compute_avg(histbins, x_bins)  # e.g. mean charge
-        trends[me]["stdev"] = compute_std(
-            histbins, x_bins, trends[me]["mean"]
-        )  # e.g. std of charge
-        trends[me]["mpv"] = x_bins[np.argmax(histbins, axis=1)]  # e.g. mpv charge
-        trends[me]["max"] = np.max(histbins, axis=1)
-        trends[me]["std_err_on_mean"] = trends[me]["stdev"] / np.sqrt(
-            histbins.shape[1]
-        )
-        trends[me]["empty_lss"] = np.array(medata.getEmptyLSs(me))
+        me_trends = _compute_stats(histbins, x_bins, excluded)
 
-    return trends
+    empty_lss = medata.getEmptyLSs(me)
+    me_trends["empty_lss"] = (
+        np.array(empty_lss) if isinstance(empty_lss, list) else empty_lss
+    )
+    # LS number of each point, runs of MultiRunMEData are padded from LS 1
+    if isinstance(medata, MEData):
+        me_trends["ls_numbers"] = medata.getLSNumbers(me)
+    else:
+        me_trends["ls_numbers"] = np.arange(1, me_trends["mean"].shape[-1] + 1)
+    return me_trends
 
 
 def plot_trends(
@@ -58,7 +115,7 @@ def plot_trends(
 
     if norm:
         for trend in to_plot:
-            trends[me][trend] = trends[me][trend] / np.sum(trends[me][trend])
+            trends[me][trend] = trends[me][trend] / np.nansum(trends[me][trend])
 
     fig = go.Figure()
 
@@ -75,7 +132,7 @@ def plot_trends(
                 visible = False
             trace = go.Scatter()
             trace.y = trends[me][stat]
-            trace.x = np.arange(len(trends[me][stat])) + 1
+            trace.x = trends[me].get("ls_numbers", np.arange(len(trends[me][stat])) + 1)
             trace.mode = "lines+markers"
             trace.visible = visible
             fig.add_trace(trace)
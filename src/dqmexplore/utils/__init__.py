@@ -1,3 +1,9 @@
 import dqmexplore.utils.datautils
 import dqmexplore.utils.omsutils
 import dqmexplore.utils.setupdials
+import dqmexplore.utils.sparseutils
+import dqmexplore.utils.archiveutils
+import dqmexplore.utils.pathutils
+import dqmexplore.utils.cacheutils
+import dqmexplore.utils.fetchutils
+import dqmexplore.utils.memutils
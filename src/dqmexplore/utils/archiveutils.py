@@ -0,0 +1,220 @@
+import numpy as np
+import json
+import struct
+import zlib
+from dqmexplore.utils.datautils import compact_counts
+from dqmexplore.utils.sparseutils import SparseLSArray
+
+ARCHIVE_MAGIC = b"DQMXARCH"
+ARCHIVE_VERSION = 2
+
+
+def _zigzag(diffs):
+    """
+    Maps wrapped integer differences to unsigned integers with small values for small magnitudes of either sign (0, -1, 1, -2... to 0, 1, 2, 3...).
+    """
+    signed = diffs.view(f"i{diffs.dtype.itemsize}")
+    return ((signed << 1) ^ (signed >> (8 * diffs.dtype.itemsize - 1))).view(
+        f"u{diffs.dtype.itemsize}"
+    )
+
+
+def _unzigzag(zigzagged, dtype):
+    unsigned = zigzagged.view(f"u{dtype.itemsize}")
+    signed = (unsigned >> 1).view(f"i{dtype.itemsize}") ^ -(unsigned & 1).view(
+        f"i{dtype.itemsize}"
+    )
+    return signed.view(dtype)
+
+
+def _encode_chunk(block, delta, level):
+    """
+    Compresses a (LS x ...) block of counts: optional zigzagged difference to the previous LS (integer types only, wrapping arithmetic keeps it lossless), byte shuffle so that bytes of equal significance are adjacent, then zlib.
+    """
+    block = np.ascontiguousarray(block)
+    if delta:
+        block = _zigzag(np.concatenate([block[:1], block[1:] - block[:-1]]))
+    shuffled = block.view(np.uint8).reshape(-1, block.dtype.itemsize).T
+    return zlib.compress(np.ascontiguousarray(shuffled).tobytes(), level)
+
+
+def _decode_chunk(payload, dtype, shape, delta):
+    dtype = np.dtype(dtype)
+    raw = np.frombuffer(zlib.decompress(payload), dtype=np.uint8)
+    block = raw.reshape(dtype.itemsize, -1).T.copy().view(dtype).reshape(shape)
+    if delta:
+        block = np.cumsum(_unzigzag(block, dtype), axis=0, dtype=dtype)
+    return block
+
+
+def _archived_counts(arr):
+    """
+    Smallest lossless type for the counts, and whether LS deltas can be taken exactly (integer types only).
+    """
+    stored = compact_counts(arr)
+    return stored, np.issubdtype(stored.dtype, np.integer)
+
+
+def write_archive(me_data, path, chunk_lss=64, level=6, delta=True):
+    """
+    Writes the data and entries of every ME of an MEData to a single file of independently compressed chunks of chunk_lss LSs, so that a range of LSs can be read without decoding the rest. Each chunk stores the counts in their smallest lossless type, as differences to the previous LS if delta is True (integer counts only), byte-shuffled and zlib-compressed with the given level.
+
+    Layout: magic, version, the chunks, a JSON header with the chunk offsets, and the header offset as the last 8 bytes.
+    """
+    header = {
+        "version": ARCHIVE_VERSION,
+        "chunk_lss": chunk_lss,
+        "numLSs": int(me_data.getNumLSs()),
+        "dtype": me_data.dtype,
+        "excluded": [int(ls) for ls in me_data.getExcluded()],
+        "mes": [],
+    }
+    with open(path, "wb") as f:
+        f.write(ARCHIVE_MAGIC)
+        f.write(struct.pack("<I", ARCHIVE_VERSION))
+        for me in me_data.getMENames():
+            me_meta = {
+                "name": me,
+                "me_id": int(me_data[me]["me_id"]),
+                "dim": int(me_data.getDims(me)),
+                "x_bins": np.asarray(me_data.getBins(me, dim="x")).tolist(),
+                "ls_numbers": np.asarray(me_data.getLSNumbers(me)).tolist(),
+                "chunks": [],
+            }
+            if me_meta["dim"] == 2:
+                me_meta["y_bins"] = np.asarray(me_data.getBins(me, dim="y")).tolist()
+
+            medata = me_data.getData(me)
+            entries = me_data.getEntries(me)
+            me_meta["shape"] = list(medata.shape[1:])
+            me_meta["data_dtype"] = str(medata.dtype)
+            me_meta["entries_dtype"] = str(entries.dtype)
+            for start in range(0, len(medata), chunk_lss):
+                stop = min(start + chunk_lss, len(medata))
+                if isinstance(medata, SparseLSArray):
+                    block = np.stack([medata[i] for i in range(start, stop)])
+                else:
+                    block = medata[start:stop]
+                chunk = []
+                for arr in [block, entries[start:stop]]:
+                    stored, exact_delta = _archived_counts(arr)
+                    payload = _encode_chunk(stored, delta and exact_delta, level)
+                    chunk.append(
+                        {
+                            "offset": f.tell(),
+                            "size": len(payload),
+                            "dtype": str(stored.dtype),
+                            "delta": bool(delta and exact_delta),
+                        }
+                    )
+                    f.write(payload)
+                me_meta["chunks"].append(chunk)
+            header["mes"].append(me_meta)
+
+        header_offset = f.tell()
+        f.write(json.dumps(header).encode())
+        f.write(struct.pack("<Q", header_offset))
+
+
+class HistArchive:
+    """
+    Reader of files written by write_archive (or MEData.toArchive). Only the chunks covering the requested LSs are read and decoded.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(ARCHIVE_MAGIC)) != ARCHIVE_MAGIC:
+                raise ValueError(f"{path} is not a histogram archive.")
+            (version,) = struct.unpack("<I", f.read(4))
+            if version > ARCHIVE_VERSION:
+                raise ValueError(
+                    f"Archive version {version} is newer than supported ({ARCHIVE_VERSION})."
+                )
+            f.seek(-8, 2)
+            (header_offset,) = struct.unpack("<Q", f.read(8))
+            end = f.tell() - 8
+            f.seek(header_offset)
+            self.header = json.loads(f.read(end - header_offset).decode())
+        self.mes = {me_meta["name"]: me_meta for me_meta in self.header["mes"]}
+        for me_meta in self.mes.values():
+            # Version 1 archives have no LS numbers, their rows are LSs 1, 2, ...
+            me_meta["ls_numbers"] = np.array(
+                me_meta.get("ls_numbers", np.arange(1, self.getNumLSs() + 1)),
+                dtype=np.int64,
+            )
+
+    def getMENames(self):
+        return list(self.mes.keys())
+
+    def getNumLSs(self):
+        return self.header["numLSs"]
+
+    def getLSNumbers(self, me):
+        return self.mes[me]["ls_numbers"]
+
+    def read(self, me, first=1, last=None):
+        """
+        Returns the LS numbers, data and entries (in their original dtypes) of the rows of an ME for LSs first to last (inclusive, the last LS by default).
+        """
+        me_meta = self.mes[me]
+        chunk_lss = self.header["chunk_lss"]
+        last = self.getNumLSs() if last is None else last
+        if first < 1 or first > last:
+            raise ValueError(f"Invalid LS range ({first}, {last}).")
+
+        # Chunks hold chunk_lss rows, which are not LS numbers if LSs are missing
+        ls_numbers = me_meta["ls_numbers"]
+        first_row = np.searchsorted(ls_numbers, first, side="left")
+        stop_row = np.searchsorted(ls_numbers, last, side="right")
+        if first_row == stop_row:
+            first_row = stop_row = 0
+        first_chunk = first_row // chunk_lss
+        last_chunk = (stop_row - 1) // chunk_lss
+        blocks = {"data": [np.zeros((0, *me_meta["shape"]))], "entries": [np.zeros(0)]}
+        with open(self.path, "rb") as f:
+            for idx in range(first_chunk, last_chunk + 1):
+                num_lss = min(chunk_lss, len(ls_numbers) - idx * chunk_lss)
+                for key, part, shape in [
+                    ("data", me_meta["chunks"][idx][0], me_meta["shape"]),
+                    ("entries", me_meta["chunks"][idx][1], []),
+                ]:
+                    f.seek(part["offset"])
+                    blocks[key].append(
+                        _decode_chunk(
+                            f.read(part["size"]),
+                            part["dtype"],
+                            (num_lss, *shape),
+                            part["delta"],
+                        )
+                    )
+
+        offset = first_chunk * chunk_lss
+        rows = slice(first_row - offset, stop_row - offset)
+        data = np.concatenate(blocks["data"])[rows].astype(me_meta["data_dtype"])
+        entries = np.concatenate(blocks["entries"])[rows].astype(
+            me_meta["entries_dtype"]
+        )
+        return ls_numbers[first_row:stop_row], data, entries
+
+    def toMEDict(self, mes=None):
+        """
+        Decodes whole MEs into the dictionary format taken by MEData.fromMEDict.
+        """
+        if mes is None:
+            mes = self.getMENames()
+        me_dict = {}
+        for me in mes:
+            me_meta = self.mes[me]
+            ls_numbers, data, entries = self.read(me)
+            me_dict[me] = {
+                "me_id": me_meta["me_id"],
+                "dim": me_meta["dim"],
+                "x_bins": np.array(me_meta["x_bins"]),
+                "data": data,
+                "entries": entries,
+                "ls_numbers": ls_numbers,
+            }
+            if me_meta["dim"] == 2:
+                me_dict[me]["y_bins"] = np.array(me_meta["y_bins"])
+        return me_dict
@@ -0,0 +1,278 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import weakref
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:
+    pa = None
+
+# Seconds before a cached response is fetched again, per endpoint
+DEFAULT_TTLS = {
+    "runs": 3600,
+    "lumisections": 3600,
+    "datasetrates": 3600,
+    "h1d": 24 * 3600,
+    "h2d": 24 * 3600,
+}
+
+# Seconds between index writes, which are otherwise done by flush() or when the cache is closed
+SAVE_INTERVAL = 10
+
+
+def _normalize(obj):
+    """
+    JSON-serializable, order independent form of filters and pages: OMSFilter/OMSPage and DIALS filter objects become dictionaries without unset (None) fields, and lists of them are sorted.
+    """
+    if hasattr(obj, "model_dump"):
+        obj = obj.model_dump()
+    if isinstance(obj, dict):
+        return {
+            str(key): _normalize(value)
+            for key, value in sorted(obj.items())
+            if value is not None
+        }
+    if isinstance(obj, (list, tuple)):
+        return sorted(
+            (_normalize(value) for value in obj),
+            key=lambda v: json.dumps(v, sort_keys=True),
+        )
+    if hasattr(obj, "item"):
+        return obj.item()
+    return obj
+
+
+def _write_index(index_path, index):
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(json.dumps(index))
+    os.replace(tmp_path, index_path)
+
+
+def cache_key(endpoint, filters, pages=None):
+    """
+    Key of a query: a hash of the endpoint and the normalized filters and pages.
+    """
+    query = {
+        "endpoint": endpoint,
+        "filters": _normalize(filters),
+        "pages": _normalize(pages),
+    }
+    return hashlib.sha256(
+        json.dumps(query, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+class ResponseCache:
+    """
+    On-disk cache of query results (OMS endpoints and DIALS histograms) as DataFrames, kept across sessions in the directory path. Each result is stored as a Feather (Arrow IPC) file, which reads back faster than Parquet for the small results of single queries, or as a pickle if pyarrow is not installed or the columns cannot be converted. An index.json holds their sizes, access times and expiry.
+
+    Results expire after the TTL of their endpoint (ttls, falling back to default_ttl, in seconds, None for never), except for closed runs, whose results never change and are kept until evicted. When the files exceed max_bytes, the least recently used ones are deleted. stats() reports hits, misses, expired entries and evictions.
+
+    Functions taking a cache argument (OMSData, oms.get_rate, omsutils.query_runs, datautils.fetch_me_df) read their results from it when present and store them otherwise. The index is written every SAVE_INTERVAL seconds, by flush() and when the cache is closed or garbage collected.
+    """
+
+    def __init__(self, path, max_bytes=2 * 1024**3, ttls=None, default_ttl=3600):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.default_ttl = default_ttl
+        self._lock = threading.RLock()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+        os.makedirs(path, exist_ok=True)
+        self._index_path = os.path.join(path, "index.json")
+        self._index = {}
+        self._saved = time.time()
+        self._dirty = False
+        if os.path.exists(self._index_path):
+            with open(self._index_path, "r") as f:
+                self._index = json.load(f)
+        self._finalizer = weakref.finalize(
+            self, _write_index, self._index_path, self._index
+        )
+
+    def _save_index(self, force=False):
+        # Index writes are batched, they are only needed to reopen the cache in later sessions
+        now = time.time()
+        if force or (self._dirty and now - self._saved > SAVE_INTERVAL):
+            _write_index(self._index_path, self._index)
+            self._saved = now
+            self._dirty = False
+
+    def flush(self):
+        """
+        Writes the index to disk.
+        """
+        with self._lock:
+            self._save_index(force=True)
+
+    def close(self):
+        """
+        Writes the index to disk. The cache should not be used afterwards.
+        """
+        with self._lock:
+            self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _remove(self, key):
+        entry = self._index.pop(key)
+        try:
+            os.remove(os.path.join(self.path, entry["file"]))
+        except FileNotFoundError:
+            pass
+
+    def get(self, endpoint, filters, pages=None):
+        """
+        Returns the cached result of a query, or None if it is missing or expired.
+        """
+        key = cache_key(endpoint, filters, pages)
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is not None and entry["expires"] is not None:
+                if entry["expires"] < time.time():
+                    self._remove(key)
+                    self._stats["expired"] += 1
+                    self._dirty = True
+                    entry = None
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            file_path = os.path.join(self.path, entry["file"])
+            file_format = entry["format"]
+        # Files are read outside the lock, so that concurrent fetches of cached results run in parallel
+        try:
+            df = self._read(file_path, file_format)
+        except FileNotFoundError:
+            # Replaced or evicted by another thread meanwhile
+            df = None
+        with self._lock:
+            if df is None or key not in self._index:
+                self._stats["misses"] += 1
+                return None
+            # Access times only order evictions, they need not be saved on every hit
+            self._index[key]["last_access"] = time.time()
+            self._stats["hits"] += 1
+            self._dirty = True
+            self._save_index()
+        return df
+
+    def _read(self, file_path, file_format):
+        if file_format == "pickle":
+            return pd.read_pickle(file_path)
+        table = feather.read_table(file_path)
+        df = table.to_pandas()
+        # Arrow reads list columns (e.g. the data of h1d and h2d histograms) as arrays of arrays, they are turned back into the (nested) lists they were stored from
+        for i, field in enumerate(table.schema):
+            if field.name in df.columns and (
+                pa.types.is_list(field.type) or pa.types.is_large_list(field.type)
+            ):
+                df[field.name] = pd.Series(
+                    table.column(i).to_pylist(), index=df.index, dtype=object
+                )
+        return df
+
+    def put(self, endpoint, filters, df, pages=None, closed=False):
+        """
+        Stores the result of a query. closed=True marks results that can no longer change (e.g. of runs that ended), which do not expire.
+        """
+        key = cache_key(endpoint, filters, pages)
+        ttl = None if closed else self.ttls.get(endpoint, self.default_ttl)
+        file_format = "pickle"
+        if pa is not None:
+            try:
+                table = pa.Table.from_pandas(df)
+                file_format = "feather"
+            except (
+                pa.ArrowInvalid,
+                pa.ArrowTypeError,
+                pa.ArrowNotImplementedError,
+            ):
+                pass
+        file_name = f"{key}.{file_format}"
+        file_path = os.path.join(self.path, file_name)
+        # Written outside the lock to a file of this thread, then moved in place under it
+        tmp_path = f"{file_path}.{threading.get_ident()}.tmp"
+        if file_format == "feather":
+            feather.write_feather(table, tmp_path)
+        else:
+            df.to_pickle(tmp_path)
+        size = os.path.getsize(tmp_path)
+        with self._lock:
+            if key in self._index:
+                self._remove(key)
+            os.replace(tmp_path, file_path)
+            now = time.time()
+            self._index[key] = {
+                "endpoint": endpoint,
+                "file": file_name,
+                "format": file_format,
+                "size": size,
+                "last_access": now,
+                "expires": None if ttl is None else now + ttl,
+            }
+            self._evict(keep=key)
+            self._dirty = True
+            self._save_index()
+
+    def mark_closed(self, endpoint, filters, pages=None):
+        """
+        Marks a cached result as closed (see put), e.g. once it turns out that its runs ended. Does nothing if it is not cached.
+        """
+        key = cache_key(endpoint, filters, pages)
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is not None and entry["expires"] is not None:
+                entry["expires"] = None
+                self._dirty = True
+                self._save_index()
+
+    def _evict(self, keep=None):
+        total = sum(entry["size"] for entry in self._index.values())
+        for key in sorted(self._index, key=lambda k: self._index[k]["last_access"]):
+            if total <= self.max_bytes:
+                break
+            if key != keep:
+                total -= self._index[key]["size"]
+                self._remove(key)
+                self._stats["evictions"] += 1
+
+    def fetch(self, endpoint, filters, fetch, pages=None, closed=False):
+        """
+        Returns the cached result of a query, calling fetch() and caching its result (unless it is None) on a miss. closed can also be a function of the fetched DataFrame.
+        """
+        df = self.get(endpoint, filters, pages=pages)
+        if df is None:
+            df = fetch()
+            if df is not None:
+                self.put(
+                    endpoint,
+                    filters,
+                    df,
+                    pages=pages,
+                    closed=closed(df) if callable(closed) else closed,
+                )
+        return df
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._index):
+                self._remove(key)
+            self._save_index(force=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                "entries": len(self._index),
+                "bytes": sum(entry["size"] for entry in self._index.values()),
+            }
@@ -2,49 +2,303 @@ import pandas as pd
 import numpy as np
 import os
 import json
+import hashlib
 import requests
 from dqmexplore.me_ids import meIDs1D, meIDs2D
+from dqmexplore.utils.sparseutils import SparseLSArray
 
-def generate_me_dict(me_df):
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+class FlatHistColumn:
     """
-    Reformats monitoring element dataframe and outputs out a reduced version of it in dictionary form, putting the data into a np array which allows for vectorized operations.
+    Histogram payloads of a dataframe held as a single flat numpy buffer instead of one Python list per row. Row i spans values[starts[i]:starts[i] + sizes[i]]. row_len is the length of the innermost lists (the x axis of 2D MEs), or None if unknown.
     """
-    mes = list(me_df["me"].unique())
 
-    # Formatting data to a way that is easier to manipulate
-    me_dict = {}
-    for me in mes:
+    def __init__(self, values, starts, sizes, row_len=None):
+        self.values = values
+        self.starts = starts
+        self.sizes = sizes
+        self.row_len = row_len
 
-        me_dict[me] = {}
+    def __len__(self):
+        return len(self.starts)
 
-        sorted_dfsubset = me_df[me_df["me"] == me].sort_values(by="ls_number")
-        me_id = sorted_dfsubset["me_id"].unique()[0]
-        if me_id in meIDs1D:
-            dim = 1
-        elif me_id in meIDs2D:
-            dim = 2
-        else:
-            raise ValueError("Unrecognized monitoring element id number")
-        data_arr = np.array(sorted_dfsubset["data"].to_list())
-        entries = np.array(sorted_dfsubset["entries"].to_list())
-
-        me_dict[me]["x_bins"] = np.linspace(
-            sorted_dfsubset["x_min"].iloc[0],
-            sorted_dfsubset["x_max"].iloc[0],
-            int(sorted_dfsubset["x_bin"].iloc[0]),
+    @classmethod
+    def from_offsets(cls, values, offsets, row_len=None):
+        """
+        Wraps a pre-flattened buffer where row i spans values[offsets[i]:offsets[i + 1]].
+        """
+        offsets = np.asarray(offsets, dtype=np.int64)
+        return cls(np.asarray(values), offsets[:-1], np.diff(offsets), row_len)
+
+    @classmethod
+    def from_arrow(cls, array):
+        """
+        Flattens a (fixed size) list or list of lists arrow array without converting it to Python objects.
+        """
+        if isinstance(array, pa.ChunkedArray):
+            array = array.combine_chunks()
+
+        offsets = _arrow_list_offsets(array)
+        values = array.flatten()
+        row_len = None
+        if _is_arrow_list(values.type):
+            # 2D payloads: compose the row offsets with the offsets of the inner lists
+            inner_offsets = _arrow_list_offsets(values)
+            inner_sizes = np.diff(inner_offsets)
+            if len(inner_sizes) > 0:
+                row_len = int(inner_sizes[0])
+                if (inner_sizes != row_len).any():
+                    raise ValueError("Histogram rows have inconsistent lengths.")
+            offsets = inner_offsets[offsets]
+            values = values.flatten()
+        return cls.from_offsets(values.to_numpy(zero_copy_only=False), offsets, row_len)
+
+    def take(self, indices):
+        return FlatHistColumn(
+            self.values, self.starts[indices], self.sizes[indices], self.row_len
         )
 
-        if dim == 2:
-            me_dict[me]["y_bins"] = np.linspace(
-                sorted_dfsubset["y_min"].iloc[0],
-                sorted_dfsubset["y_max"].iloc[0],
-                int(sorted_dfsubset["y_bin"].iloc[0]),
-            )
+    def stack(self, start, stop, x_bin=None):
+        """
+        Returns rows start to stop as an (LS x bins) or (LS x y x x) array. When the rows are adjacent in the buffer, a view is returned without copying.
+        """
+        starts = self.starts[start:stop]
+        sizes = self.sizes[start:stop]
+        if len(starts) == 0:
+            return self.values[:0]
+        size = sizes[0]
+        if (sizes != size).any():
+            raise ValueError("Histograms of the same ME have different lengths.")
+
+        row_len = self.row_len if self.row_len is not None else x_bin
+        shape = (len(starts), size) if row_len is None else (len(starts), -1, row_len)
+        if (np.diff(starts) == size).all():
+            first = starts[0]
+            return self.values[first : first + len(starts) * size].reshape(shape)
+        # Gather rows through a sliding window view to avoid an index array per bin
+        windows = np.lib.stride_tricks.sliding_window_view(self.values, size)
+        return windows[starts].reshape(shape)
+
+
+def _is_arrow_list(arrow_type):
+    return (
+        pa.types.is_list(arrow_type)
+        or pa.types.is_large_list(arrow_type)
+        or pa.types.is_fixed_size_list(arrow_type)
+    )
+
+
+def _arrow_list_offsets(array):
+    if pa.types.is_fixed_size_list(array.type):
+        return np.arange(len(array) + 1, dtype=np.int64) * array.type.list_size
+    offsets = array.offsets.to_numpy().astype(np.int64)
+    return offsets - offsets[0]
+
+
+def _is_arrow_column(series):
+    return pa is not None and isinstance(series.dtype, pd.ArrowDtype)
+
+
+def me_df_columns(me_df, data_buffer=None):
+    """
+    Returns the columns of a monitoring element dataframe or pyarrow Table as numpy arrays. Arrow-backed "data" columns and pre-flattened (values, offsets) buffers are wrapped in a FlatHistColumn instead of being converted to Python lists.
+    """
+    if pa is not None and isinstance(me_df, pa.Table):
+        columns = {
+            name: me_df.column(name).to_numpy()
+            for name in me_df.column_names
+            if name != "data"
+        }
+        if "data" in me_df.column_names:
+            columns["data"] = FlatHistColumn.from_arrow(me_df.column("data"))
+    else:
+        columns = {}
+        for name in me_df.columns:
+            if name == "data" and _is_arrow_column(me_df[name]):
+                columns[name] = FlatHistColumn.from_arrow(pa.array(me_df[name].array))
+            else:
+                columns[name] = me_df[name].to_numpy()
+
+    if data_buffer is not None:
+        columns["data"] = FlatHistColumn.from_offsets(*data_buffer)
+    return columns
+
+
+def index_me_rows(me_df, data_buffer=None, keys=("ls_number",)):
+    """
+    Sorts the rows of a monitoring element dataframe by (me, *keys) in a single pass. MEs keep their order of first appearance. Returns the columns (see me_df_columns) in sorted order and a dictionary mapping each ME to the (start, stop) slice holding its rows.
+    """
+    columns = me_df_columns(me_df, data_buffer=data_buffer)
+    codes, mes = pd.factorize(columns["me"])
+    order = np.lexsort([columns[key] for key in reversed(keys)] + [codes])
+    bounds = np.searchsorted(codes[order], np.arange(len(mes) + 1))
+
+    for name, column in columns.items():
+        columns[name] = (
+            column.take(order) if isinstance(column, FlatHistColumn) else column[order]
+        )
+    me_rows = {me: (int(bounds[i]), int(bounds[i + 1])) for i, me in enumerate(mes)}
+    return columns, me_rows
+
+
+def build_me_entry(columns, start, stop):
+    """
+    Builds the dictionary entry of a single monitoring element from a contiguous slice of sorted columns (see index_me_rows).
+    """
+    me_id = columns["me_id"][start]
+    if me_id in meIDs1D:
+        dim = 1
+    elif me_id in meIDs2D:
+        dim = 2
+    else:
+        raise ValueError("Unrecognized monitoring element id number")
+
+    me_entry = {}
+    me_entry["x_bins"] = np.linspace(
+        columns["x_min"][start],
+        columns["x_max"][start],
+        int(columns["x_bin"][start]),
+    )
+
+    if dim == 2:
+        me_entry["y_bins"] = np.linspace(
+            columns["y_min"][start],
+            columns["y_max"][start],
+            int(columns["y_bin"][start]),
+        )
+
+    me_entry["me_id"] = me_id
+    me_entry["dim"] = dim
+    if isinstance(columns["data"], FlatHistColumn):
+        me_entry["data"] = columns["data"].stack(
+            start, stop, x_bin=int(columns["x_bin"][start]) if dim == 2 else None
+        )
+    else:
+        me_entry["data"] = np.array(columns["data"][start:stop].tolist())
+    me_entry["entries"] = columns["entries"][start:stop]
+    me_entry["ls_numbers"] = np.asarray(
+        columns["ls_number"][start:stop], dtype=np.int64
+    )
+    return me_entry
+
+
+def compact_counts(arr):
+    """
+    Casts histogram counts to the smallest unsigned integer type that holds them exactly. Arrays with negative or fractional values are cast to float32 only if that is lossless, and returned unchanged otherwise.
+    """
+    if isinstance(arr, SparseLSArray):
+        values = compact_counts(arr.values)
+        return SparseLSArray(values, arr.indices, arr.indptr, arr.shape)
+    arr = np.asarray(arr)
+    if arr.size == 0:
+        return arr.astype(np.uint8)
+    if np.issubdtype(arr.dtype, np.integer) or (arr == np.floor(arr)).all():
+        if arr.min() >= 0:
+            return arr.astype(np.min_scalar_type(int(arr.max())))
+    if np.issubdtype(arr.dtype, np.floating) and arr.dtype.itemsize > 4:
+        arr32 = arr.astype(np.float32)
+        if (arr32 == arr).all():
+            return arr32
+    return arr
 
-        me_dict[me]["me_id"] = me_id
-        me_dict[me]["dim"] = dim
-        me_dict[me]["data"] = data_arr
-        me_dict[me]["entries"] = entries
+
+def accumulator_dtype(dtype):
+    """
+    Returns the type used to sum arrays of the given dtype without overflow or loss of integer precision.
+    """
+    if np.issubdtype(dtype, np.unsignedinteger):
+        return np.uint64
+    if np.issubdtype(dtype, np.integer):
+        return np.int64
+    return np.float64
+
+
+def merge_ls_ranges(ls_ranges):
+    """
+    Converts a list of LSs and (first, last) LS tuples into a sorted (k x 2) array of disjoint, inclusive LS intervals.
+    """
+    intervals = []
+    for ls_range in ls_ranges:
+        if isinstance(ls_range, (int, np.integer)):
+            intervals.append((ls_range, ls_range))
+        elif isinstance(ls_range, tuple):
+            if (len(ls_range) != 2) or (ls_range[0] > ls_range[1]):
+                raise Exception(
+                    "Could not expand tuple into range of LSs. Make sure it has two elements and the first one is not larger than the second."
+                )
+            intervals.append(ls_range)
+        else:
+            raise TypeError("Incompatible element type in list of LSs.")
+    if len(intervals) == 0:
+        return np.empty((0, 2), dtype=np.int64)
+
+    intervals = np.array(sorted(intervals), dtype=np.int64)
+    merged = [intervals[0]]
+    for first, last in intervals[1:]:
+        if first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return np.array(merged, dtype=np.int64)
+
+
+def subtract_ls_ranges(intervals, to_remove):
+    """
+    Removes the LSs in to_remove from intervals, both given as outputs of merge_ls_ranges.
+    """
+    result = []
+    for first, last in intervals:
+        for rm_first, rm_last in to_remove:
+            if rm_last < first or rm_first > last:
+                continue
+            if rm_first > first:
+                result.append((first, rm_first - 1))
+            first = rm_last + 1
+            if first > last:
+                break
+        if first <= last:
+            result.append((first, last))
+    return np.array(result, dtype=np.int64).reshape(-1, 2)
+
+
+def ls_ranges_mask(intervals, num_lss):
+    """
+    Boolean mask over LSs 1 to num_lss that is True inside the given intervals (an output of merge_ls_ranges). Intervals are clipped to the LS range.
+    """
+    first = np.clip(intervals[:, 0], 1, num_lss + 1) - 1
+    last = np.clip(intervals[:, 1], 0, num_lss)
+    delta = np.zeros(num_lss + 1, dtype=np.int64)
+    np.add.at(delta, first, 1)
+    np.add.at(delta, last, -1)
+    return np.cumsum(delta[:-1]) > 0
+
+
+def array_fingerprint(arr):
+    """
+    Content hash of an array, used to key cached products on array inputs such as trigger rates.
+    """
+    arr = np.ascontiguousarray(arr)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{arr.dtype}{arr.shape}".encode())
+    digest.update(arr.tobytes())
+    return digest.hexdigest()
+
+
+def generate_me_dict(me_df):
+    """
+    Reformats monitoring element dataframe and outputs out a reduced version of it in dictionary form, putting the data into a np array which allows for vectorized operations.
+    """
+    columns, me_rows = index_me_rows(me_df)
+
+    # Formatting data to a way that is easier to manipulate
+    me_dict = {}
+    for me, (start, stop) in me_rows.items():
+        me_dict[me] = build_me_entry(columns, start, stop)
 
     return me_dict
 
@@ -72,20 +326,21 @@ def integrate(data_dict, ls_filter=[]):
     return data_dict
 
 
-def trig_normalize(data_dict, trigger_rates: np.ndarray) -> np.ndarray:
+def trig_normalize(data_dict, trigger_rates: np.ndarray, inplace=False) -> np.ndarray:
     """
-    Normalize by trigger rate.
+    Normalize by trigger rate. The rates are broadcast against the histograms instead of being repeated over the bins. With inplace=True, floating point data is divided in place.
     """
+    trigger_rates = np.asarray(trigger_rates)
     mes = list(data_dict.keys())
     for me in mes:
-        if data_dict[me]["dim"] == 1:
-            data_dict[me]["data"] = data_dict[me]["data"] / trigger_rates[:, np.newaxis]
-        elif data_dict[me]["dim"] == 2:
-            n = data_dict[me]["data"].shape[1]
-            m = data_dict[me]["data"].shape[2]
-            data_dict[me]["data"] = data_dict[me]["data"] / np.repeat(
-                trigger_rates[:, np.newaxis], n * m, axis=1
-            ).reshape(-1, n, m)
+        data = data_dict[me]["data"]
+        if data_dict[me]["dim"] not in (1, 2):
+            continue
+        rates = trigger_rates.reshape(-1, *[1] * (data.ndim - 1))
+        if inplace and np.issubdtype(data.dtype, np.floating):
+            np.divide(data, rates, out=data)
+        else:
+            data_dict[me]["data"] = data / rates
     return data_dict
 
 
@@ -120,6 +375,28 @@ def print_availMEs(dials, dims=None, contains=""):
     for me in mes_df[mes_df["me"].str.contains(contains)]["me"]:
         print(me)
 
+
+def fetch_me_df(
+    dials, filters, max_pages=None, cache=None, closed=False, executor=None
+):
+    """
+    Fetches the per-LS histograms matching LumisectionHistogram1DFilters or LumisectionHistogram2DFilters as a DataFrame, in the format taken by MEData. A cached result is kept without expiry if closed (e.g. for runs that ended).
+    """
+    endpoint = "h2d" if "2D" in type(filters).__name__ else "h1d"
+
+    def fetch():
+        list_all = getattr(dials, endpoint).list_all
+        if executor is not None:
+            return executor.call(list_all, filters, max_pages=max_pages).to_pandas()
+        return list_all(filters, max_pages=max_pages).to_pandas()
+
+    if cache is None:
+        return fetch()
+    return cache.fetch(
+        endpoint, filters, fetch, pages={"max_pages": max_pages}, closed=closed
+    )
+
+
 def loadJSONasDF(JSONFilePath):
     if not os.path.exists(JSONFilePath):
         raise FileNotFoundError(
@@ -135,6 +412,7 @@ def loadJSONasDF(JSONFilePath):
         jsondf = pd.DataFrame(JSONdict.items()).convert_dtypes()
     return jsondf
 
+
 def loadFromWeb(url, output_file):
     try:
         # Make request and check if succesful
@@ -142,11 +420,11 @@ def loadFromWeb(url, output_file):
         if response.status_code == 200:
             # Parse the response content as JSON
             data = response.json()
-            
+
             # Store the data as JSON
-            with open(output_file, 'w') as file:
+            with open(output_file, "w") as file:
                 json.dump(data, file, indent=4)
-            
+
             print(f"Data successfully fetched and stored in {output_file}")
         else:
             print(f"Failed to fetch data. HTTP Status Code: {response.status_code}")
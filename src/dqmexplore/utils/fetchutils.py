@@ -0,0 +1,176 @@
+import random
+import threading
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# HTTP statuses worth retrying: rate limited, or a temporary server or gateway failure
+TRANSIENT_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+def is_transient(exc):
+    """
+    Whether a failed request may succeed if retried: connection errors, timeouts and transient HTTP statuses.
+    """
+    if isinstance(exc, requests.HTTPError):
+        return (
+            exc.response is not None and exc.response.status_code in TRANSIENT_STATUSES
+        )
+    return isinstance(
+        exc,
+        (
+            requests.ConnectionError,
+            requests.Timeout,
+            ConnectionError,
+            TimeoutError,
+        ),
+    )
+
+
+def _retry_after(exc):
+    """
+    Seconds requested by the server through a Retry-After header, if any.
+    """
+    response = getattr(exc, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Allows on average rate calls per second, in bursts of up to burst calls.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Takes a token, waiting for one if the bucket is empty.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class FetchResult:
+    """
+    Outcome of FetchExecutor.map: results and failures are {key: value} and {key: exception} dictionaries, and durations holds the seconds each call took.
+    """
+
+    def __init__(self):
+        self.results = {}
+        self.failures = {}
+        self.durations = {}
+
+    @property
+    def ok(self):
+        return len(self.failures) == 0
+
+    def __repr__(self):
+        return (
+            f"FetchResult({len(self.results)} succeeded, {len(self.failures)} failed)"
+        )
+
+
+class FetchExecutor:
+    """
+    Runs OMS and DIALS requests with at most max_workers in flight, at most rate requests per second (token bucket with bursts of burst, no limit if rate is None), and retries of transient errors (see is_transient) with exponential backoff: the n-th retry waits backoff * 2**(n - 1) seconds (at most max_backoff, or the server's Retry-After) with up to 50% random jitter.
+
+    A single executor can be shared by several OMSData objects and DIALS fetches so that the limits hold for all of them together. Functions taking an executor argument (OMSData, oms.get_rate, the omsutils fetches, datautils.fetch_me_df) make every request through its call method; without one, requests are made directly.
+    """
+
+    def __init__(
+        self,
+        max_workers=4,
+        rate=None,
+        burst=1,
+        retries=3,
+        backoff=0.5,
+        max_backoff=30,
+        transient=is_transient,
+    ):
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.transient = transient
+        self._bucket = None if rate is None else TokenBucket(rate, burst=burst)
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "retries": 0, "failures": 0}
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def call(self, func, *args, **kwargs):
+        """
+        Makes one request, func(*args, **kwargs), within the concurrency and rate limits, retrying transient errors. The last error is raised once the retries are exhausted.
+        """
+        for attempt in range(self.retries + 1):
+            if self._bucket is not None:
+                self._bucket.acquire()
+            self._count("requests")
+            try:
+                with self._slots:
+                    return func(*args, **kwargs)
+            except Exception as e:
+                if attempt == self.retries or not self.transient(e):
+                    self._count("failures")
+                    raise
+                delay = _retry_after(e)
+                if delay is None:
+                    delay = min(self.max_backoff, self.backoff * 2**attempt)
+                    delay *= 1 + 0.5 * random.random()
+                self._count("retries")
+                time.sleep(delay)
+
+    def as_completed(self, func, items, keys=None):
+        """
+        Calls func(item) for every item on a pool of max_workers threads and yields (key, result, exception, seconds) tuples in the order in which the calls finish, keys being the items by default and exception None on success. func makes its requests through call, so that they are limited and retried.
+        """
+        items = list(items)
+        keys = items if keys is None else list(keys)
+
+        def run(item):
+            start = time.perf_counter()
+            try:
+                return func(item), None, time.perf_counter() - start
+            except Exception as e:
+                return None, e, time.perf_counter() - start
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(run, item): key for key, item in zip(keys, items)}
+            for future in as_completed(futures):
+                yield (futures[future], *future.result())
+
+    def map(self, func, items, keys=None):
+        """
+        Same as as_completed, but waits for all calls and collects their outcomes in a FetchResult.
+        """
+        fetch_result = FetchResult()
+        for key, result, exception, seconds in self.as_completed(func, items, keys):
+            if exception is None:
+                fetch_result.results[key] = result
+            else:
+                fetch_result.failures[key] = exception
+            fetch_result.durations[key] = seconds
+        return fetch_result
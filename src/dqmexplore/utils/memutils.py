@@ -0,0 +1,228 @@
+import os
+import shutil
+import tempfile
+import weakref
+from collections import OrderedDict
+import numpy as np
+from dqmexplore.utils.sparseutils import SparseLSArray
+
+# Small per-ME arrays that are never spilled to disk
+RESIDENT_KEYS = ["x_bins", "y_bins", "ls_numbers", "ls_index"]
+SPARSE_PARTS = ["values", "indices", "indptr"]
+
+
+class MemoryManager:
+    """
+    Keeps the ME entries of an MEData within bounds. In lazy mode, at most max_resident built entries are kept, the least recently used ones being dropped. With a memory budget, the arrays of the least recently used entries are spilled to a scratch directory once the per-ME arrays exceed memory_budget bytes, and read back on their next access.
+
+    me_dict and buffers are the entries and append buffers of the MEData, shared with it.
+    """
+
+    def __init__(self, me_dict, buffers, lazy=False, max_resident=None):
+        self.me_dict = me_dict
+        self.buffers = buffers
+        self.lazy = lazy
+        self.max_resident = max_resident
+        self.memory_budget = None
+        self._resident = OrderedDict()
+        self._evicted_keys = {}
+        self._scratch_dir = None
+        self._sizes = OrderedDict()
+        self._pinned = set()
+        self._pinned_sizes = {}
+        self._resident_bytes = 0
+        self._spill_ids = {}
+        self._stats = {"hits": 0, "spills": 0, "reloads": 0, "spilled_bytes": 0}
+
+    def access(self, me):
+        """
+        Records an access to a built entry, evicting or spilling others to stay within the bounds. Accesses to entries that were neither just built nor spilled count as hits.
+        """
+        hit = True
+        if self.lazy:
+            hit = me in self._resident
+            self._resident[me] = None
+            self._resident.move_to_end(me)
+            if self.max_resident is not None:
+                while len(self._resident) > self.max_resident:
+                    evicted, _ = self._resident.popitem(last=False)
+                    self._evict(evicted)
+        if self.memory_budget is not None:
+            hit = self._track(me) and hit
+        if hit:
+            self._stats["hits"] += 1
+
+    def _evict(self, me):
+        self.forget(me)
+        keys = self.me_dict.pop(me).get("keys")
+        # Products are recomputed from their keys when the ME is built again
+        if keys:
+            self._evicted_keys[me] = keys
+
+    def popEvictedKeys(self, me):
+        return self._evicted_keys.pop(me, None)
+
+    def setBudget(self, memory_budget, scratch_dir=None):
+        """
+        Sets the memory budget in bytes, spilling to a temporary directory under scratch_dir (the system default if None). None reloads every spilled entry.
+        """
+        if memory_budget is None:
+            for me in self.me_dict:
+                self._reload(me)
+            self._sizes = OrderedDict()
+            self._pinned_sizes = {}
+            self._resident_bytes = 0
+        elif self._scratch_dir is None:
+            self._scratch_dir = tempfile.mkdtemp(prefix="dqmexplore-", dir=scratch_dir)
+            weakref.finalize(self, shutil.rmtree, self._scratch_dir, True)
+        self.memory_budget = memory_budget
+
+    def pin(self, mes):
+        """
+        Reloads entries and keeps them in memory from then on, e.g. the members of a batch while and after they are stacked.
+        """
+        for me in mes:
+            self._resident_bytes -= self._sizes.pop(me, 0)
+            self._pinned.add(me)
+            if self.memory_budget is not None:
+                self._reload(me)
+                self._resize(me)
+
+    def unpin(self, mes=None):
+        for me in list(self._pinned) if mes is None else mes:
+            self._pinned.discard(me)
+            if me in self._pinned_sizes:
+                self._sizes[me] = self._pinned_sizes.pop(me)
+        if self.memory_budget is not None:
+            self._enforce()
+
+    def getStats(self):
+        """
+        Accesses that found the ME in memory (hits), MEs written to disk (spills) and read back (reloads), and the bytes in memory and on disk.
+        """
+        return {
+            **self._stats,
+            "resident_bytes": self._resident_bytes,
+            "budget": self.memory_budget,
+        }
+
+    def _spillable(self, key, value):
+        return (
+            key not in RESIDENT_KEYS
+            and isinstance(value, (np.ndarray, SparseLSArray))
+            and not isinstance(value, np.memmap)
+        )
+
+    def _size(self, me):
+        """
+        Bytes held by the arrays of an entry, counting the full capacity of its append buffers.
+        """
+        arrays = [
+            value
+            for key, value in self.me_dict[me].items()
+            if self._spillable(key, value)
+        ]
+        buffers = list(self.buffers.get(me, {}).values())
+        if len(buffers) == 0:
+            return sum(arr.nbytes for arr in arrays)
+        owned = {id(buffer) for buffer in buffers}
+        return sum(buffer.nbytes for buffer in buffers) + sum(
+            arr.nbytes
+            for arr in arrays
+            if id(arr) not in owned and id(getattr(arr, "base", None)) not in owned
+        )
+
+    def _track(self, me):
+        """
+        Reloads an entry if needed and updates its size, then spills the least recently used entries until the total is within the budget. Returns whether the entry was in memory.
+        """
+        reloaded = self._reload(me)
+        self._resize(me)
+        if me not in self._pinned:
+            self._sizes.move_to_end(me)
+        self._enforce(keep=me)
+        return not reloaded
+
+    def _resize(self, me):
+        sizes = self._pinned_sizes if me in self._pinned else self._sizes
+        size = self._size(me)
+        self._resident_bytes += size - sizes.get(me, 0)
+        sizes[me] = size
+
+    def _enforce(self, keep=None):
+        # Pinned entries are not in _sizes, so the least recently used entry is always spillable
+        while self._resident_bytes > self.memory_budget and len(self._sizes) > 0:
+            candidate = next(iter(self._sizes))
+            if candidate == keep:
+                break
+            self._spill(candidate)
+
+    def _spill(self, me):
+        me_entry = self.me_dict[me]
+        arrays, sparse = {}, {}
+        for key, value in list(me_entry.items()):
+            if not self._spillable(key, value):
+                continue
+            if isinstance(value, SparseLSArray):
+                for part in SPARSE_PARTS:
+                    arrays[f"{key}.{part}"] = getattr(value, part)
+                sparse[key] = value.shape
+            else:
+                arrays[key] = value
+            del me_entry[key]
+        # Buffers are reallocated by the next append
+        self.buffers.pop(me, None)
+        if me not in self._spill_ids:
+            self._spill_ids[me] = len(self._spill_ids)
+        # One raw file per ME, overwritten by its next spill, keeps file operations to a minimum
+        path = os.path.join(self._scratch_dir, f"{self._spill_ids[me]}.bin")
+        layout = {}
+        with open(path, "wb") as f:
+            for name, arr in arrays.items():
+                arr = np.ascontiguousarray(arr)
+                layout[name] = (arr.dtype, arr.shape)
+                arr.tofile(f)
+        size = self._sizes.pop(me)
+        me_entry["_spilled"] = {
+            "path": path,
+            "layout": layout,
+            "sparse": sparse,
+            "size": size,
+        }
+
+        self._resident_bytes -= size
+        self._stats["spills"] += 1
+        self._stats["spilled_bytes"] += size
+
+    def _reload(self, me):
+        me_entry = self.me_dict.get(me)
+        spilled = None if me_entry is None else me_entry.pop("_spilled", None)
+        if spilled is None:
+            return False
+        loaded = {}
+        with open(spilled["path"], "rb") as f:
+            for name, (dtype, shape) in spilled["layout"].items():
+                count = int(np.prod(shape))
+                loaded[name] = np.fromfile(f, dtype=dtype, count=count).reshape(shape)
+        for key, shape in spilled["sparse"].items():
+            me_entry[key] = SparseLSArray(
+                *[loaded.pop(f"{key}.{part}") for part in SPARSE_PARTS], shape
+            )
+        me_entry.update(loaded)
+        self._stats["reloads"] += 1
+        self._stats["spilled_bytes"] -= spilled["size"]
+        return True
+
+    def forget(self, me):
+        """
+        Stops tracking an entry that is dropped, removing its spill file.
+        """
+        self._resident_bytes -= self._sizes.pop(me, 0) + self._pinned_sizes.pop(me, 0)
+        self._pinned.discard(me)
+        spilled = self.me_dict[me].pop("_spilled", None)
+        if spilled is not None:
+            self._stats["spilled_bytes"] -= spilled["size"]
+        if me in self._spill_ids:
+            path = os.path.join(self._scratch_dir, f"{self._spill_ids.pop(me)}.bin")
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,213 @@
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from cmsdials.filters import OMSFilter, OMSPage
+
+# Records requested per OMS page
+OMS_PAGE_LIMIT = 10000
+
+
+def group_runs(runnbs, max_gap=0):
+    """
+    Sorts run numbers into groups that can be fetched with a single GE/LE run range query (and its pages). Consecutive runs share a group if at most max_gap run numbers that were not requested lie between them (their records are fetched and dropped). max_gap=None puts every run in its own group.
+    """
+    groups = []
+    for run in sorted(set(int(run) for run in runnbs)):
+        if groups and max_gap is not None and run - groups[-1][-1] - 1 <= max_gap:
+            groups[-1].append(run)
+        else:
+            groups.append([run])
+    return groups
+
+
+def run_range_filters(first, last, attribute_name="run_number"):
+    """
+    Filters selecting the runs first to last (inclusive), a single EQ filter for one run.
+    """
+    if first == last:
+        return [OMSFilter(attribute_name=attribute_name, value=first, operator="EQ")]
+    return [
+        OMSFilter(attribute_name=attribute_name, value=first, operator="GE"),
+        OMSFilter(attribute_name=attribute_name, value=last, operator="LE"),
+    ]
+
+
+def _query_page(dials, endpoint, filters, offset, limit, executor=None):
+    pages = [OMSPage(attribute_name="limit", value=limit)]
+    if offset > 0:
+        pages.append(OMSPage(attribute_name="offset", value=offset))
+    if executor is None:
+        response = dials.oms.query(endpoint=endpoint, filters=filters, pages=pages)
+    else:
+        response = executor.call(
+            dials.oms.query, endpoint=endpoint, filters=filters, pages=pages
+        )
+    return response if response else {"data": []}
+
+
+def iter_pages(
+    dials, endpoint, filters, page_limit=OMS_PAGE_LIMIT, max_workers=4, executor=None
+):
+    """
+    Yields the records of every page of a query, in order, as (offset, total, records) tuples. total is the number of records reported by OMS (None if it is not reported). Once it is known from the first page, the remaining pages are requested concurrently on max_workers threads; otherwise pages are requested one after the other until one is shorter than the first.
+    """
+    first = _query_page(dials, endpoint, filters, 0, page_limit, executor)
+    records = first.get("data", [])
+    total = (first.get("meta") or {}).get("totalResourceCount")
+    yield 0, total, records
+    if len(records) == 0:
+        return
+
+    # The server may cap the page size below page_limit
+    step = len(records)
+    if total is not None:
+        offsets = range(step, total, step)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            responses = pool.map(
+                lambda offset: _query_page(
+                    dials, endpoint, filters, offset, step, executor
+                ),
+                offsets,
+            )
+            for offset, response in zip(offsets, responses):
+                yield offset, total, response.get("data", [])
+    else:
+        # Without a total, a page shorter than the first one (or empty) is the last
+        offset = 0
+        while len(records) == step:
+            offset += step
+            records = _query_page(
+                dials, endpoint, filters, offset, page_limit, executor
+            ).get("data", [])
+            yield offset, total, records
+
+
+def _columns_to_frame(columns):
+    df = pd.DataFrame(columns).infer_objects()
+    # Numbers with missing values may stay object, convert them like pandas does for lists.
+    # Booleans with missing values stay object, as in makeDF.
+    for column in df.columns:
+        if pd.api.types.is_object_dtype(df[column]) and pd.api.types.infer_dtype(
+            df[column], skipna=True
+        ) in ("integer", "floating", "mixed-integer-float"):
+            df[column] = pd.to_numeric(df[column])
+    return df
+
+
+def fetch_frame(
+    dials, endpoint, filters, page_limit=OMS_PAGE_LIMIT, max_workers=4, executor=None
+):
+    """
+    Fetches all pages of a query into one DataFrame. The records of each page are written into per-column buffers sized from the total count of the first page as soon as the page arrives, instead of concatenating page DataFrames. Returns None if there are no records.
+    """
+    columns = None
+    filled = 0
+    for offset, total, records in iter_pages(
+        dials,
+        endpoint,
+        filters,
+        page_limit=page_limit,
+        max_workers=max_workers,
+        executor=executor,
+    ):
+        if len(records) == 0:
+            continue
+        if columns is None:
+            size = total if total is not None else len(records)
+            columns = {
+                key: np.empty(size, dtype=object) for key in records[0]["attributes"]
+            }
+        capacity = len(next(iter(columns.values())))
+        if offset + len(records) > capacity:
+            # Count unknown or grown since the first page, doubling keeps the copies linear in the number of records
+            capacity = max(offset + len(records), 2 * capacity)
+            for key, buffer in columns.items():
+                columns[key] = np.empty(capacity, dtype=object)
+                columns[key][:filled] = buffer[:filled]
+        for key, buffer in columns.items():
+            buffer[offset : offset + len(records)] = [
+                record["attributes"].get(key) for record in records
+            ]
+        filled = max(filled, offset + len(records))
+    if columns is None:
+        return None
+    return _columns_to_frame({key: buffer[:filled] for key, buffer in columns.items()})
+
+
+def iter_frames(
+    dials, endpoint, filters, page_limit=OMS_PAGE_LIMIT, max_workers=4, executor=None
+):
+    """
+    Same as fetch_frame, but yields one DataFrame per page as pages arrive.
+    """
+    for _, _, records in iter_pages(
+        dials,
+        endpoint,
+        filters,
+        page_limit=page_limit,
+        max_workers=max_workers,
+        executor=executor,
+    ):
+        if len(records) > 0:
+            yield _columns_to_frame(
+                {
+                    key: [record["attributes"].get(key) for record in records]
+                    for key in records[0]["attributes"]
+                }
+            )
+
+
+def _select_runs(df, runs):
+    # Demultiplex: drop the runs in the gaps of the range
+    if df is None or "run_number" not in df.columns:
+        return df
+    return df[df["run_number"].isin(runs)].reset_index(drop=True)
+
+
+def query_runs(
+    dials,
+    endpoint,
+    runs,
+    page_limit=OMS_PAGE_LIMIT,
+    max_workers=4,
+    cache=None,
+    closed=False,
+    executor=None,
+):
+    """
+    Fetches the records of an OMS endpoint for a sorted group of runs (see group_runs) with one run range query, following its pages (see fetch_frame). Returns a DataFrame with the records of the requested runs only, or None. The whole range is cached, closed being a bool or a function of the fetched DataFrame.
+    """
+    filters = run_range_filters(runs[0], runs[-1])
+
+    def fetch():
+        return fetch_frame(
+            dials,
+            endpoint,
+            filters,
+            page_limit=page_limit,
+            max_workers=max_workers,
+            executor=executor,
+        )
+
+    if cache is None:
+        df = fetch()
+    else:
+        df = cache.fetch(endpoint, filters, fetch, closed=closed)
+    return _select_runs(df, runs)
+
+
+def iter_runs(
+    dials, endpoint, runs, page_limit=OMS_PAGE_LIMIT, max_workers=4, executor=None
+):
+    """
+    Same as query_runs, but yields one DataFrame per page.
+    """
+    for df in iter_frames(
+        dials,
+        endpoint,
+        run_range_filters(runs[0], runs[-1]),
+        page_limit=page_limit,
+        max_workers=max_workers,
+        executor=executor,
+    ):
+        yield _select_runs(df, runs)
@@ -0,0 +1,107 @@
+import re
+from bisect import bisect_left
+from fnmatch import fnmatchcase
+
+GLOB_CHARS = set("*?[")
+REGEX_CHARS = set(".^$*+?{}[]\\|()")
+
+
+class MEPathIndex:
+    """
+    Tree over ME paths such as PixelPhase1/Tracks/PXBarrel/charge_PXLayer_1, one node per folder. Paths are kept sorted by their folders, so the MEs under any node are a contiguous slice of names, found without scanning the other MEs.
+    """
+
+    def __init__(self, names):
+        self.names = sorted(names, key=lambda name: name.split("/"))
+        self._sorted = sorted(names)
+        self.root = self._newNode(0)
+        for i, name in enumerate(self.names):
+            node = self.root
+            node["stop"] = i + 1
+            for segment in name.split("/"):
+                if segment not in node["children"]:
+                    node["children"][segment] = self._newNode(i)
+                node = node["children"][segment]
+                node["stop"] = i + 1
+            node["leaf"] = name
+
+    @staticmethod
+    def _newNode(start):
+        return {"children": {}, "start": start, "stop": start, "leaf": None}
+
+    def __len__(self):
+        return len(self.names)
+
+    def node(self, path):
+        """
+        Returns the node of a folder or ME path, or None if no ME is under it.
+        """
+        node = self.root
+        for segment in path.strip("/").split("/") if path.strip("/") else []:
+            node = node["children"].get(segment)
+            if node is None:
+                return None
+        return node
+
+    def subtree(self, path):
+        """
+        MEs under a folder path (or the ME itself), in index order.
+        """
+        node = self.node(path)
+        return [] if node is None else self.names[node["start"] : node["stop"]]
+
+    def prefix(self, prefix):
+        """
+        MEs whose name starts with prefix, which may end in the middle of a folder or ME name.
+        """
+        start = bisect_left(self._sorted, prefix)
+        stop = start
+        while stop < len(self._sorted) and self._sorted[stop].startswith(prefix):
+            stop += 1
+        return self._sorted[start:stop]
+
+    def glob(self, pattern):
+        """
+        MEs matching a glob pattern segment by segment: * and ? do not cross folders, and a ** segment matches any number of folders. Literal segments are dictionary lookups, so only the matching branches are visited.
+        """
+        segments = pattern.strip("/").split("/")
+        found = set()
+
+        def match(node, idx):
+            if idx == len(segments):
+                if node["leaf"] is not None:
+                    found.add(node["leaf"])
+                return
+            segment = segments[idx]
+            if segment == "**":
+                match(node, idx + 1)
+                for child in node["children"].values():
+                    match(child, idx)
+            elif GLOB_CHARS.isdisjoint(segment):
+                child = node["children"].get(segment)
+                if child is not None:
+                    match(child, idx + 1)
+            else:
+                for name, child in node["children"].items():
+                    if fnmatchcase(name, segment):
+                        match(child, idx + 1)
+
+        match(self.root, 0)
+        return [name for name in self.names if name in found]
+
+    def regex(self, pattern):
+        """
+        MEs matching a regular expression from the start of their name. The literal text before the first special character narrows the search to a prefix.
+        """
+        literal = ""
+        for char in pattern:
+            if char in REGEX_CHARS:
+                break
+            literal += char
+        # A quantifier applies to the last literal character, which is then optional
+        if len(literal) < len(pattern) and pattern[len(literal)] in "*?{":
+            literal = literal[:-1]
+        if "|" in pattern:
+            literal = ""
+        compiled = re.compile(pattern)
+        return [name for name in self.prefix(literal) if compiled.match(name)]
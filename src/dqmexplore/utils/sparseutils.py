@@ -0,0 +1,150 @@
+import numpy as np
+
+
+class SparseLSArray:
+    """
+    Compressed sparse row storage for per-LS histograms of shape (LS x y x x), where most bins are empty. The non-zero bins of LS row i are values[indptr[i]:indptr[i + 1]], at flat bin positions indices[...] of the shared (y x x) layout.
+
+    Implements the subset of the numpy array interface used by MEData: len, shape, ndim, dtype, nbytes, integer indexing (returns a dense histogram), slicing of contiguous LSs (returns a SparseLSArray), sum, max, astype and toarray, plus divide for normalizations.
+    """
+
+    def __init__(self, values, indices, indptr, shape):
+        self.values = values
+        self.indices = indices
+        self.indptr = indptr
+        self.shape = tuple(shape)
+
+    @classmethod
+    def from_dense(cls, arr, chunk_lss=256):
+        """
+        Converts a dense (LS x ...) array, chunk_lss LSs at a time to bound the temporary memory.
+        """
+        arr = np.asarray(arr)
+        n_bins = int(np.prod(arr.shape[1:]))
+        values, indices, counts = [], [], []
+        for start in range(0, len(arr), chunk_lss):
+            block = arr[start : start + chunk_lss].reshape(-1, n_bins)
+            rows, cols = np.nonzero(block)
+            values.append(block[rows, cols])
+            indices.append(cols.astype(np.int32))
+            counts.append(np.bincount(rows, minlength=len(block)))
+        indptr = np.zeros(len(arr) + 1, dtype=np.int64)
+        if len(arr) > 0:
+            np.cumsum(np.concatenate(counts), out=indptr[1:])
+        return cls(
+            np.concatenate(values) if values else arr.reshape(-1)[:0],
+            np.concatenate(indices) if indices else np.zeros(0, dtype=np.int32),
+            indptr,
+            arr.shape,
+        )
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def dtype(self):
+        return self.values.dtype
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.indices.nbytes + self.indptr.nbytes
+
+    @property
+    def density(self):
+        return len(self.values) / max(int(np.prod(self.shape)), 1)
+
+    def __getitem__(self, ls_idx):
+        if isinstance(ls_idx, slice):
+            start, stop, step = ls_idx.indices(len(self))
+            if step != 1:
+                raise TypeError("SparseLSArray only supports contiguous LS slices.")
+            stop = max(start, stop)
+            first, last = self.indptr[start], self.indptr[stop]
+            return SparseLSArray(
+                self.values[first:last],
+                self.indices[first:last],
+                self.indptr[start : stop + 1] - first,
+                (stop - start, *self.shape[1:]),
+            )
+        if not isinstance(ls_idx, (int, np.integer)):
+            raise TypeError(
+                "SparseLSArray only supports indexing single LSs or LS slices."
+            )
+        if ls_idx < 0:
+            ls_idx += len(self)
+        start, stop = self.indptr[ls_idx], self.indptr[ls_idx + 1]
+        dense = np.zeros(int(np.prod(self.shape[1:])), dtype=self.dtype)
+        dense[self.indices[start:stop]] = self.values[start:stop]
+        return dense.reshape(self.shape[1:])
+
+    def _rows(self):
+        return np.repeat(np.arange(len(self)), np.diff(self.indptr))
+
+    def _coords(self):
+        """
+        Full (LS, y, x) coordinates of every stored value.
+        """
+        return (self._rows(), *np.unravel_index(self.indices, self.shape[1:]))
+
+    def _gather(self, arr):
+        """
+        Values of a dense array broadcastable to self.shape at the stored positions.
+        """
+        return np.broadcast_to(arr, self.shape)[self._coords()]
+
+    def toarray(self):
+        dense = np.zeros(self.shape, dtype=self.dtype)
+        dense[self._coords()] = self.values
+        return dense
+
+    def astype(self, dtype):
+        return SparseLSArray(
+            self.values.astype(dtype), self.indices, self.indptr, self.shape
+        )
+
+    def sum(self, axis=None, dtype=None, keepdims=False, where=True):
+        """
+        Same semantics as numpy.sum. Sums are accumulated in float64 and are exact for integer counts up to 2**53. Without dtype, the result has the accumulator type of the values (see datautils.accumulator_dtype), so compact counts do not overflow.
+        """
+        # datautils imports this module
+        from dqmexplore.utils.datautils import accumulator_dtype
+
+        if dtype is None:
+            dtype = accumulator_dtype(self.dtype)
+        axes = tuple(range(self.ndim)) if axis is None else np.atleast_1d(axis)
+        axes = tuple(ax % self.ndim for ax in axes)
+        kept = [ax for ax in range(self.ndim) if ax not in axes]
+        kept_shape = [self.shape[ax] for ax in kept]
+
+        weights = self.values.astype(np.float64)
+        if where is not True:
+            weights = weights * self._gather(where)
+        if len(kept) == 0:
+            return weights.sum().astype(dtype)
+        coords = self._coords()
+        keys = np.ravel_multi_index([coords[ax] for ax in kept], kept_shape)
+        result = np.bincount(
+            keys, weights=weights, minlength=int(np.prod(kept_shape))
+        ).reshape(kept_shape)
+        if keepdims:
+            result = np.expand_dims(result, axes)
+        return result.astype(dtype)
+
+    def max(self, where=True, initial=0):
+        values = self.values if where is True else self.values[self._gather(where)]
+        return values.max(initial=initial)
+
+    def divide(self, divisor, where=True, dtype=None):
+        """
+        Element-wise division by a dense array broadcastable to self.shape, keeping the sparsity pattern. Positions where "where" is False are set to zero.
+        """
+        values = np.zeros(len(self.values), dtype=dtype)
+        mask = (
+            np.ones(len(values), dtype=bool) if where is True else self._gather(where)
+        )
+        np.divide(self.values, self._gather(divisor), out=values, where=mask)
+        return SparseLSArray(values, self.indices, self.indptr, self.shape)
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The package sources and the fake OMS backend shared with the benchmarks
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
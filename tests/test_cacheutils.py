@@ -0,0 +1,67 @@
+from functools import partial
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+from cmsdials.filters import (
+    LumisectionHistogram1DFilters,
+    LumisectionHistogram2DFilters,
+)
+
+from dqmexplore.utils.cacheutils import ResponseCache
+from dqmexplore.utils.datautils import fetch_me_df
+
+
+def histograms(dim, n_lss=4, n_bins=3):
+    # Per-LS histograms in the format of the DIALS h1d and h2d endpoints
+    rng = np.random.default_rng(dim)
+    shape = (n_bins,) if dim == 1 else (n_bins, n_bins + 1)
+    return pd.DataFrame(
+        {
+            "run_number": 380000,
+            "ls_number": np.arange(1, n_lss + 1),
+            "me": f"PixelPhase1/Test/h{dim}d",
+            "entries": rng.integers(0, 100, n_lss),
+            "data": [rng.random(shape).tolist() for _ in range(n_lss)],
+        }
+    )
+
+
+class FakeHistogramDials:
+    def __init__(self):
+        self.requests = []
+        self.h1d = SimpleNamespace(list_all=partial(self._list_all, 1))
+        self.h2d = SimpleNamespace(list_all=partial(self._list_all, 2))
+
+    def _list_all(self, dim, filters, max_pages=None):
+        self.requests.append(dim)
+        return SimpleNamespace(to_pandas=lambda: histograms(dim))
+
+
+@pytest.mark.parametrize(
+    "filters",
+    [
+        LumisectionHistogram1DFilters(run_number=380000),
+        LumisectionHistogram2DFilters(run_number=380000),
+    ],
+)
+def test_cache_hit_matches_miss(tmp_path, filters):
+    dials = FakeHistogramDials()
+    cache = ResponseCache(str(tmp_path))
+    miss = fetch_me_df(dials, filters, cache=cache)
+    hit = fetch_me_df(dials, filters, cache=cache)
+    assert len(dials.requests) == 1
+    assert cache.stats()["hits"] == 1
+    pd.testing.assert_frame_equal(hit, miss)
+    assert hit["data"].map(type).eq(list).all()
+
+
+def test_index_is_written_on_close(tmp_path):
+    dials = FakeHistogramDials()
+    filters = LumisectionHistogram2DFilters(run_number=380000)
+    with ResponseCache(str(tmp_path)) as cache:
+        miss = fetch_me_df(dials, filters, cache=cache)
+    reopened = ResponseCache(str(tmp_path))
+    pd.testing.assert_frame_equal(fetch_me_df(dials, filters, cache=reopened), miss)
+    assert len(dials.requests) == 1
@@ -0,0 +1,60 @@
+import time
+import warnings
+
+import pytest
+
+from fake_oms import FakeDials
+from dqmexplore.omsdata import OMSData
+from dqmexplore.utils.fetchutils import FetchExecutor
+
+RUNNBS = list(range(380000, 380012))
+
+
+def fetch(dials, executor, **kwargs):
+    oms_data = OMSData(dials, executor=executor)
+    oms_data.setRuns(RUNNBS)
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        fetch_result = oms_data.fetchData("lumisections", **kwargs)
+    return oms_data, fetch_result, caught
+
+
+def test_transient_errors_are_retried():
+    expected, _, _ = fetch(FakeDials(RUNNBS), FetchExecutor(), max_gap=None)
+    dials = FakeDials(RUNNBS, error_rate=0.3)
+    executor = FetchExecutor(retries=10, backoff=0.001)
+    oms_data, fetch_result, caught = fetch(dials, executor, max_gap=None)
+    assert fetch_result.ok and len(caught) == 0
+    assert executor.stats["retries"] > 0
+    assert executor.stats["requests"] == len(dials.oms.requests)
+    assert oms_data["lumisections"].equals(expected["lumisections"])
+
+
+def test_runs_are_lost_once_retries_run_out():
+    dials = FakeDials(RUNNBS, error_rate=1.0)
+    executor = FetchExecutor(retries=2, backoff=0.001)
+    _, fetch_result, caught = fetch(dials, executor, max_gap=None)
+    assert set(fetch_result.failures) == set(RUNNBS)
+    assert all("503" in str(e) for e in fetch_result.failures.values())
+    # Transient errors are retried, not bisected: retries + 1 attempts per run
+    assert len(dials.oms.requests) == 3 * len(RUNNBS)
+    assert executor.stats["failures"] == len(RUNNBS)
+    assert len(caught) == 1 and "380000" in str(caught[0].message)
+
+
+@pytest.mark.parametrize("max_workers", [1, 3])
+def test_requests_in_flight_are_bounded(max_workers):
+    # Small pages, so that every run range also fetches further pages concurrently
+    dials = FakeDials(RUNNBS, n_lss=(100, 200), max_limit=20, latency=0.005)
+    fetch(dials, FetchExecutor(max_workers=max_workers), max_gap=None)
+    assert dials.oms.max_in_flight == max_workers
+
+
+def test_rate_paces_requests():
+    executor = FetchExecutor(rate=50, burst=5)
+    start = time.perf_counter()
+    for _ in range(15):
+        executor.call(lambda: None)
+    # The first 5 requests use the burst, the other 10 wait 1/50 s each
+    assert time.perf_counter() - start >= 10 / 50 * 0.9
+    assert executor.stats["requests"] == 15
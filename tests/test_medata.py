@@ -0,0 +1,231 @@
+import numpy as np
+import pytest
+
+from synthetic import make_me_df
+from dqmexplore.medata import MEData
+from dqmexplore.trends import compute_trends
+from dqmexplore.utils.archiveutils import HistArchive
+
+ME = "Synthetic/Folder_0/me_0"
+
+
+@pytest.fixture
+def me_df():
+    return make_me_df(n_mes=3, n_lss=12, x_bin=5)
+
+
+def dense(arr):
+    return arr.toarray() if hasattr(arr, "toarray") else np.asarray(arr)
+
+
+def assert_same(me_data, expected, types=("data",)):
+    assert sorted(me_data.getMENames()) == sorted(expected.getMENames())
+    assert me_data.getNumLSs() == expected.getNumLSs()
+    for me in expected.getMENames():
+        np.testing.assert_array_equal(
+            me_data.getLSNumbers(me), expected.getLSNumbers(me)
+        )
+        np.testing.assert_array_equal(me_data.getEntries(me), expected.getEntries(me))
+        assert list(me_data.getEmptyLSs(me)) == list(expected.getEmptyLSs(me))
+        for type in types:
+            np.testing.assert_allclose(
+                dense(me_data.getData(me, type=type)),
+                dense(expected.getData(me, type=type)),
+            )
+
+
+def rows_sum(me_data, me, lss):
+    return me_data.getData(me)[me_data.getRows(me, lss)].sum(axis=0)
+
+
+def test_integrate_ranges_honours_exclusions(me_df):
+    me_data = MEData(me_df)
+    me_data.setExcluded([(2, 2)])
+    me_data.integrateRanges([(1, 6)], exclude=[5])
+    np.testing.assert_array_equal(
+        me_data.getIntegral(ME), rows_sum(me_data, ME, [1, 3, 4, 6])
+    )
+    # Recomputed with the requested ranges when the exclusions change
+    me_data.setExcluded([(3, 4)])
+    np.testing.assert_array_equal(
+        me_data.getIntegral(ME), rows_sum(me_data, ME, [1, 2, 6])
+    )
+
+
+@pytest.mark.parametrize("fmt", ["save", "store", "archive"])
+def test_round_trip_keeps_trailing_lss_without_rows(tmp_path, me_df, fmt):
+    me_data = MEData(me_df)
+    me_data.setExcluded([(10, 12)])
+    merged = me_data.mergeLSs(every=3)
+    assert merged.getNumLSs() == 4
+    if fmt == "save":
+        merged.save(str(tmp_path / "merged.npz"))
+        reopened = MEData.load(str(tmp_path / "merged.npz"))
+    elif fmt == "store":
+        merged.toStore(str(tmp_path / "merged"))
+        reopened = MEData.fromStore(str(tmp_path / "merged"))
+    else:
+        merged.toArchive(str(tmp_path / "merged.arch"))
+        reopened = MEData.fromArchive(str(tmp_path / "merged.arch"))
+    assert reopened.getNumLSs() == 4
+    np.testing.assert_array_equal(reopened.getLSNumbers(ME), [1, 2, 3])
+
+
+def test_append_with_missing_lss_matches_full_build(me_df):
+    me_1 = "Synthetic/Folder_1/me_1"
+    full = me_df[me_df["ls_number"] != 8]
+    # An empty LS, and an LS that arrives after the later ones
+    empty = (full["me"] == ME) & (full["ls_number"] == 10)
+    full.loc[empty, "entries"] = 0
+    full.loc[empty, "data"] = full.loc[empty, "data"].map(lambda d: [0.0] * len(d))
+    late = (full["me"] == me_1) & (full["ls_number"] == 3)
+    chunks = [
+        full[(full["ls_number"] <= 6) & ~late],
+        full[full["ls_number"] > 6],
+        full[late],
+    ]
+    trigger_rate = np.linspace(500, 1500, 12)
+
+    me_data = MEData(chunks[0])
+    me_data.normData()
+    me_data.normData(trigger_rate=trigger_rate)
+    me_data.integrateData()
+    for chunk in chunks[1:]:
+        me_data.append(chunk, trigger_rate=trigger_rate)
+
+    expected = MEData(full)
+    expected.normData()
+    expected.normData(trigger_rate=trigger_rate)
+    expected.integrateData()
+    assert_same(me_data, expected, types=["data", "norm", "trignorm", "integral"])
+    assert me_data.getEmptyLSs(ME) == [10]
+    assert not me_data.hasLS(ME, 8)
+    assert me_data.hasLS(me_1, 3)
+
+
+@pytest.fixture
+def gapped_df(me_df):
+    # LS 8 missing for every ME, LS 3 for one of them
+    me_df = me_df[me_df["ls_number"] != 8]
+    return me_df[~((me_df["me"] == ME) & (me_df["ls_number"] == 3))]
+
+
+@pytest.mark.parametrize("dtype", [None, "compact"])
+def test_append_in_chunks_matches_full_build(gapped_df, dtype):
+    trigger_rate = np.linspace(500, 1500, 12)
+    intervals = [(2, 5), (9, 11)]
+
+    def derive(me_data):
+        me_data.normData()
+        me_data.normData(trigger_rate=trigger_rate)
+        me_data.buildCumsum()
+        me_data.integrateRanges(intervals)
+
+    me_data = MEData(gapped_df[gapped_df["ls_number"] <= 4], dtype=dtype)
+    derive(me_data)
+    for first, last in [(5, 5), (6, 9), (10, 12)]:
+        chunk = gapped_df[gapped_df["ls_number"].between(first, last)]
+        me_data.append(chunk, trigger_rate=trigger_rate)
+
+    expected = MEData(gapped_df, dtype=dtype)
+    derive(expected)
+    assert_same(me_data, expected, types=["data", "norm", "trignorm", "integral"])
+    for me in expected.getMENames():
+        np.testing.assert_array_equal(me_data[me]["cumsum"], expected[me]["cumsum"])
+
+
+def test_append_overwrite_replaces_rows(me_df):
+    me_data = MEData(me_df)
+    me_data.integrateData()
+    with pytest.raises(ValueError):
+        me_data.append(me_df[me_df["ls_number"] == 4])
+    doubled = me_df[me_df["ls_number"] == 4].copy()
+    doubled["data"] = doubled["data"].map(lambda d: [2 * x for x in d])
+    me_data.append(doubled, on_duplicate="overwrite")
+
+    expected_df = me_df.copy()
+    expected_df.loc[doubled.index, "data"] = doubled["data"]
+    expected = MEData(expected_df)
+    expected.integrateData()
+    assert_same(me_data, expected, types=["data", "integral"])
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [{}, {"dtype": "compact"}, {"sparse": True}],
+    ids=["dense", "compact", "sparse"],
+)
+@pytest.mark.parametrize("fmt", ["save", "store", "archive", "archive_no_delta"])
+def test_round_trips(tmp_path, kwargs, fmt):
+    me_df = make_me_df(n_mes=3, n_lss=10, x_bin=6, y_bin=4, occupancy=0.3)
+    me_df = me_df[me_df["ls_number"] != 4]
+    me_data = MEData(me_df, **kwargs)
+    me_data.setExcluded([(6, 7)])
+    if fmt == "save":
+        me_data.save(str(tmp_path / "me_data.npz"))
+        reopened = MEData.load(str(tmp_path / "me_data.npz"))
+    elif fmt == "store":
+        me_data.toStore(str(tmp_path / "me_data"))
+        reopened = MEData.fromStore(str(tmp_path / "me_data"))
+    else:
+        path = str(tmp_path / "me_data.arch")
+        me_data.toArchive(path, chunk_lss=3, delta=fmt == "archive")
+        reopened = MEData.fromArchive(path)
+    assert_same(reopened, me_data)
+    assert reopened.getExcluded() == me_data.getExcluded()
+    for me in me_data.getMENames():
+        assert reopened.getData(me).dtype == me_data.getData(me).dtype
+
+
+def test_archive_reads_ls_ranges(tmp_path, gapped_df):
+    me_data = MEData(gapped_df, dtype="compact")
+    path = str(tmp_path / "me_data.arch")
+    me_data.toArchive(path, chunk_lss=4)
+    archive = HistArchive(path)
+    for first, last in [(1, 12), (2, 3), (3, 9), (8, 8), (11, 12)]:
+        ls_numbers, data, entries = archive.read(ME, first, last)
+        expected_ls, expected_data = me_data.getLSRange(ME, first, last)
+        np.testing.assert_array_equal(ls_numbers, expected_ls)
+        np.testing.assert_array_equal(data, expected_data)
+        np.testing.assert_array_equal(
+            entries, me_data.getEntries(ME)[me_data.getRows(ME, ls_numbers)]
+        )
+
+
+def test_tiny_memory_budget_matches_unbounded(me_df):
+    trigger_rate = np.linspace(500, 1500, 12)
+
+    def derive(me_data):
+        me_data.setExcluded([(2, 3)])
+        me_data.normData()
+        me_data.integrateData()
+        return compute_trends(me_data, trigger_rates=trigger_rate)
+
+    unbounded = MEData(me_df)
+    expected_trends = derive(unbounded)
+    me_data = MEData(me_df, memory_budget=1)
+    trends = derive(me_data)
+    assert_same(me_data, unbounded, types=["data", "norm", "trignorm", "integral"])
+    for me, me_trends in expected_trends.items():
+        for stat, values in me_trends.items():
+            np.testing.assert_allclose(trends[me][stat], values)
+    stats = me_data.getMemoryStats()
+    assert stats["spills"] > 0 and stats["reloads"] > 0 and stats["hits"] > 0
+
+
+def test_memory_stats_count_hits(me_df):
+    me_data = MEData(me_df, lazy=True, max_resident=1)
+    me_data.getEntries(ME)
+    hits = me_data.getMemoryStats()["hits"]
+    me_data.getEntries(ME)
+    assert me_data.getMemoryStats()["hits"] == hits + 1
+
+    # Every ME but the last one built is spilled
+    me_data = MEData(me_df, memory_budget=1)
+    spilled = me_data.getMENames()[0]
+    before = me_data.getMemoryStats()
+    me_data.getEntries(spilled)
+    me_data.getEntries(spilled)
+    after = me_data.getMemoryStats()
+    assert after["reloads"] == before["reloads"] + 1
+    assert after["hits"] == before["hits"] + 1
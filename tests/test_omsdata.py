@@ -0,0 +1,95 @@
+import warnings
+
+import pandas as pd
+import pytest
+
+from fake_oms import FakeDials
+from dqmexplore.omsdata import OMSData
+from dqmexplore.utils.cacheutils import ResponseCache, cache_key
+from dqmexplore.utils.fetchutils import FetchExecutor
+from dqmexplore.utils.omsutils import fetch_frame, run_range_filters
+
+ENDPOINTS = ["runs", "lumisections"]
+
+
+def fetch(dials, runnbs, cache=None, **kwargs):
+    oms_data = OMSData(dials, cache=cache, executor=FetchExecutor(backoff=0.001))
+    oms_data.setRuns(runnbs)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        fetch_results = oms_data.fetchAll(ENDPOINTS, **kwargs)
+    return oms_data, fetch_results
+
+
+@pytest.fixture
+def runnbs():
+    # Two blocks of consecutive runs, 100 run numbers apart
+    return list(range(380000, 380020)) + list(range(380120, 380130))
+
+
+def pages(n_records, limit=50):
+    return -(-n_records // limit)
+
+
+def test_run_ranges_match_per_run_queries(runnbs):
+    dials = FakeDials(runnbs, n_lss=(5, 120), max_limit=50)
+    n_lss = {run: len(dials.oms.tables["lumisections"][run]) for run in runnbs}
+    per_run, _ = fetch(dials, runnbs, max_gap=None)
+    # runs: one request per run, lumisections: the pages of every run
+    assert len(dials.oms.requests) == len(runnbs) + sum(
+        pages(n) for n in n_lss.values()
+    )
+
+    dials.oms.requests.clear()
+    ranges, fetch_results = fetch(dials, runnbs, max_gap=10)
+    blocks = [runnbs[:20], runnbs[20:]]
+    # One range query per block, lumisections paginated over the whole block
+    assert len(dials.oms.requests) == len(blocks) + sum(
+        pages(sum(n_lss[run] for run in block)) for block in blocks
+    )
+    assert all(fetch_result.ok for fetch_result in fetch_results.values())
+    assert len(ranges["lumisections"]) == sum(n_lss.values())
+    for endpoint in ENDPOINTS:
+        pd.testing.assert_frame_equal(
+            ranges[endpoint].sort_index(), per_run[endpoint].sort_index()
+        )
+
+
+def test_broken_run_only_loses_itself(runnbs):
+    dials = FakeDials(runnbs, broken_runs=[380010])
+    oms_data, fetch_results = fetch(dials, runnbs, max_gap=10)
+    for endpoint in ENDPOINTS:
+        assert set(fetch_results[endpoint].failures) == {380010}
+        fetched = set(oms_data[endpoint]["run_number"])
+        assert fetched == set(runnbs) - {380010}
+
+
+def test_pages_without_total_count(runnbs, monkeypatch):
+    dials = FakeDials(runnbs, n_lss=(5, 120), max_limit=50)
+    filters = run_range_filters(runnbs[0], runnbs[-1])
+    expected = fetch_frame(dials, "lumisections", filters)
+    query = dials.oms.query
+
+    def query_without_total(*args, **kwargs):
+        response = query(*args, **kwargs)
+        response.pop("meta")
+        return response
+
+    monkeypatch.setattr(dials.oms, "query", query_without_total)
+    dials.oms.requests.clear()
+    df = fetch_frame(dials, "lumisections", filters)
+    pd.testing.assert_frame_equal(df, expected)
+    # Pages are requested until one is short
+    assert len(dials.oms.requests) == len(df) // 50 + 1
+
+
+def test_ranges_fetched_with_runs_are_cached_as_closed(tmp_path, runnbs):
+    dials = FakeDials(runnbs)
+    dials.oms.startRun(runnbs[-1])
+    cache = ResponseCache(str(tmp_path))
+    fetch(dials, runnbs, cache=cache, max_gap=10)
+    for endpoint in ENDPOINTS:
+        ended = cache_key(endpoint, run_range_filters(runnbs[0], runnbs[19]))
+        ongoing = cache_key(endpoint, run_range_filters(runnbs[20], runnbs[-1]))
+        assert cache._index[ended]["expires"] is None
+        assert cache._index[ongoing]["expires"] is not None